@@ -5,10 +5,16 @@ __all__ = ['effects',
            'gameloop',
            'mixin',
            'music',
+           'parallax',
+           'pathfinding',
            'point',
+           'preload',
            'quadtree',
+           'shape',
            'sound',
+           'spatial',
            'spritesheet',
+           'streaming',
            'text',
            'tiledimage',
            'tilemap',
@@ -21,8 +27,9 @@ __all__ = ['effects',
            'GameLoop', 'World', 'Image', 'Entity']
 
 # convenience imports
-import entity, gameloop, util, world, mixin, music, point, sound, text, \
-       tiledimage, tilemap, tween, tweenfunc, emitter, effects
+import entity, gameloop, util, world, mixin, music, point, shape, sound, \
+       spatial, text, tiledimage, tilemap, tween, tweenfunc, emitter, effects, \
+       parallax, pathfinding, preload, streaming
 
 from gameloop import Game, GameLoop
 from world import World
@@ -36,17 +36,12 @@ class Effect(object):
 
     def stop(self):
         """Stop the effect. This method is used to clean up anything done by
-           the effect, such as resetting the camera. It also forces a redraw
-           for any game objects that are set to scroll. (Non-scrolling objects
-           are considered immune to effects.) Subclasses should override this
-           method with their own code before C{super}."""
+           the effect, such as resetting the camera. (Moving the camera
+           doesn't touch the sprites themselves; the display list applies it
+           when drawing.) Subclasses should override this method with their
+           own code before C{super}."""
         self.duration = 0
         Game.world.removeUpdater(self.update)
-        for e in Game.world.getEntities():
-            if e.scroll:
-                # force a recenter and redraw
-                e._recenter()
-                e.dirty = 1
 
     def update(self):
         """Update the effect for the next frame. This is essentially the same
@@ -61,12 +56,6 @@ class Effect(object):
             else:
                 self.stop()
 
-            for e in Game.world.getEntities():
-                if e.scroll:
-                    # force a recenter and redraw
-                    e._recenter()
-                    e.dirty = 1
-
     def effect(self):
         """The code for the actual effect. Subclasses must override this method
            if they want to do anything. (Note that there is no C{super} call.)"""
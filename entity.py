@@ -1,8 +1,8 @@
 ##import pygame
-import point, world, util, tween, tweenfunc
+import point, world, util, tween, tweenfunc, shape
 
 from world import Game
-from util import Struct
+from util import Struct, Directions
 
 __doc__ = """Classes that can be used to create game objects
 
@@ -19,6 +19,33 @@ interpolations, or tweens, which are defined in the tween module."""
 
 __all__ = ['Image', 'Entity', 'Tweener']
 
+class _HookDispatch(type):
+    """Metaclass for sprites that works out, once per class, which of the
+       optional hook methods (such as the collision responses) do anything.
+
+       A class lists the hooks it provides no-op defaults for in its
+       C{_defaultHooks} attribute. When a sprite class is created, each hook
+       whose default is overridden by some other class in its MRO (a subclass
+       or a mixin) goes into the C{_hooks} set, and each hook that is also
+       implemented I{after} the default in the MRO goes into C{_chainedHooks}.
+       Callers can skip hooks that aren't in C{_hooks}, and the defaults only
+       need to make a C{super} call for hooks in C{_chainedHooks}.
+    """
+    def __init__(cls, name, bases, attrs):
+        super(_HookDispatch, cls).__init__(name, bases, attrs)
+
+        mro = cls.__mro__
+        hooks, chained = set(), set()
+        for pos, base in enumerate(mro):
+            for hook in base.__dict__.get('_defaultHooks', ()):
+                if any(hook in c.__dict__ for c in mro if c is not base):
+                    hooks.add(hook)
+                if any(hook in c.__dict__ for c in mro[pos+1:]):
+                    chained.add(hook)
+
+        cls._hooks = frozenset(hooks)
+        cls._chainedHooks = frozenset(chained)
+
 class Image(Game.Sprite.DirtySprite):
     """A class representing any drawable object.
 
@@ -34,7 +61,9 @@ class Image(Game.Sprite.DirtySprite):
        parameters C{x}, C{y}, C{width}, and C{height}. Finally, C{w} and C{h},
        as keyword arguments, are synonyms for C{width} and C{height}, respectively.
 
-       @ivar rect: The rectangle representing the object's on-screen drawing area.
+       @ivar rect: The rectangle representing the object's drawing area, in
+           world coordinates. (The display list moves it to the screen, using
+           the camera position and the object's scroll factor, when drawing.)
            This is also used as the bounding box in collision detection if the
            C{hitbox} property is not present.
        @ivar pixels: A Surface object containing the object's bitmap,
@@ -54,6 +83,11 @@ class Image(Game.Sprite.DirtySprite):
            frame in that animation's list.
        @ivar scroll: A L{Point} representing the "scroll factor" of this object.
        @ivar name: A string identifying this image, if needed.
+       @ivar tags: A frozenset of the tags given to this image (see L{addTag}).
+       @ivar shape: A collision L{Shape} (from the L{shape} module) for this
+           object, or None to use its bounding box (or C{hitbox}) and mask.
+       @ivar collisionLayers: A bitmask of the collision layers this object
+           is on. Spatial queries can be limited to certain layers.
        @ivar filename: The name of an image file to load. (This is equivalent
            to calling the C{load} method after creating this Image.)
 
@@ -64,11 +98,25 @@ class Image(Game.Sprite.DirtySprite):
        @keyword w: A synonym for C{width}.
        @keyword h: A synonym for C{height}.
        @keyword name: An identifying name for this object.
+       @keyword tags: A sequence of tags for this object.
+       @keyword shape: A collision L{Shape} for this object.
+       @keyword collisionLayers: The collision layers bitmask for this object.
        """
+    __metaclass__ = _HookDispatch
+
+    # collision response hooks that have default versions here
+    _defaultHooks = ('onCollision', 'hitLeft', 'hitRight', 'hitTop', 'hitBottom')
+
+    # Images don't move on their own, so they have no velocity
+    _moving = False
+
 ##    def __init__(self, x=0.0, y=0.0, w=0.0, h=0.0):
     def __init__(self, *args, **kwargs):
         super(Image, self).__init__()
 
+        # spatial indexes (see the spatial module) that hold this sprite
+        self._indexes = []
+
         # handle positional and keyword arguments
         # (position arguments take precedence)
         x = kwargs.get('x',0.0)
@@ -131,8 +179,18 @@ class Image(Game.Sprite.DirtySprite):
         self._parent = None
 
         # name of this object
+        self._name = None
         self.name = kwargs.get('name', '')
 
+        # tags for finding groups of objects
+        self._tags = set(kwargs.get('tags', ()))
+
+        # collision shape (None means the bounding box)
+        self.shape = kwargs.get('shape', None)
+
+        # collision layers that this object is on (a bitmask)
+        self.collisionLayers = kwargs.get('collisionLayers', 1)
+
         # load an image
         if 'filename' in kwargs:
             self.load(kwargs['filename'])
@@ -180,6 +238,7 @@ class Image(Game.Sprite.DirtySprite):
                 nextframe = self.currentFrame
 
             self.pixels = self._frames[nextframe]
+            self.redraw()
             self._w, self._h = self.rect.size = self.image.get_size()
 
             self._recenter()
@@ -195,6 +254,10 @@ class Image(Game.Sprite.DirtySprite):
         self.dirty = 1 if self.dirty == 0 else self.dirty
         self._recenter()
 
+        # we might have moved, so let the spatial indexes know
+        if self._indexes:
+            self._touch()
+
     ###
     # Child methods
     ###
@@ -244,7 +307,7 @@ class Image(Game.Sprite.DirtySprite):
            @param fname: The filename of a bitmap to load into this object.
            @return: This object, to allow for chained methods.
         """
-        self.pixels = Game.Image.load(fname)
+        self.pixels = Game.loadImage(fname)
         self.rect.size = self.image.get_size()
         self._w, self._h = self.rect.size
         self.redraw()
@@ -259,7 +322,7 @@ class Image(Game.Sprite.DirtySprite):
                it is loaded into this object.
            @return: This object, to allow for chained methods.
         """
-        self.pixels = Game.Image.load(fname)
+        self.pixels = Game.loadImage(fname)
         self.angle = angle
         self.rect.size = self.image.get_size()
         self._w, self._h = self.rect.size
@@ -276,7 +339,7 @@ class Image(Game.Sprite.DirtySprite):
                then it will simply be placed at the end of the list.
            @return: This object, to allow for chained methods.
         """
-        frame = Game.Image.load(fname)
+        frame = Game.loadImage(fname)
 
         if frameid is None or frameid >= len(self._frames):
             # no frame # or out of range means that we just add it to the end
@@ -305,7 +368,7 @@ class Image(Game.Sprite.DirtySprite):
                to right. If False, they run from top to bottom.
            @return: This object, for chaining.
            """
-        astrip = Game.Image.load(fname)
+        astrip = Game.loadImage(fname)
 
         # if we got a specific number of frames, use that,
         # otherwise calculate how many frames we need,
@@ -475,6 +538,8 @@ class Image(Game.Sprite.DirtySprite):
     def background(self, scrolling=None):
         """Moves this sprite to the background, optionally setting it to scroll.
 
+           @note: A background that doesn't need to be a sprite is much
+           cheaper to draw as a L{ParallaxLayer}.
            @param scrolling: The new scroll factor for this object.
         """
         for g in self.groups():
@@ -581,7 +646,10 @@ class Image(Game.Sprite.DirtySprite):
     def overlap(self, other, checkAlive=False):
         """Tests whether this object and another overlap.
 
-           This method uses a series of collision detection tests. First,
+           This method uses a series of collision detection tests. If either
+           object has a C{shape}, then the two shapes are tested against each
+           other (an object without a shape is treated as a box the size of
+           its C{hitbox} or C{rect}), and the result returned. Otherwise,
            a bounding-box collision is tested (optionally using user-defined
            C{hitbox} attributes). If the two objects' bounding boxes collide,
            then, if both objects have a C{mask} attribute, a pixel-level
@@ -605,7 +673,21 @@ class Image(Game.Sprite.DirtySprite):
         if isinstance(other, Game.Rect):
             # pygame Rect objects don't have any sprite-like attributes,
             # so we treat them separately
-            return self.rect.colliderect(other)
+            if self.shape is None:
+                return self.rect.colliderect(other)
+            else:
+                oshape, opos = shape.fromRect(other)
+                return shape.overlap(self.shape, self._placement(), oshape, opos)
+        elif self.shape is not None or \
+             getattr(other, 'shape', None) is not None:
+            # at least one object has a shape, so the shapes decide
+            sshape, spos = self._collisionShape()
+            if hasattr(other, "_collisionShape"):
+                oshape, opos = other._collisionShape()
+            else:
+                # a plain pygame sprite gets a box the size of its rect
+                oshape, opos = shape.fromRect(other.rect)
+            return shape.overlap(sshape, spos, oshape, opos)
         else:
             # First check a hitbox collision
             if hasattr(self, "hitbox"):
@@ -642,9 +724,6 @@ class Image(Game.Sprite.DirtySprite):
            @return: The result of calling this object's response methods.
         """
         if self.overlap(other, checkAlive):
-            # direction(s) of collision
-            _l, _r, _t, _b = False, False, False, False
-
             # figure out which sides of the sprite are colliding
 ##            _lrect = Game.Rect(self.rect.left, self.rect.top, 1, self.rect.height-1)
 ##            _rrect = Game.Rect(self.rect.right-2, self.rect.top, 1, self.rect.height-1)
@@ -658,37 +737,41 @@ class Image(Game.Sprite.DirtySprite):
 
             # figure out which sides of this object are colliding,
             # based on velocity/position data
-            selfvx,selfvy = self.velocity if hasattr(self, 'velocity') else 0,0
-            othervx,othervy = other.velocity if hasattr(other, 'velocity') else 0,0
-            orect = other.rect if not isinstance(other,Game.Rect) else other
+            if isinstance(other, Game.Rect):
+                orect, ovel = other, point.ZeroPoint
+            else:
+                orect = other.rect
+                ovel = other.velocity if other._moving else point.ZeroPoint
+            svel = self.velocity if self._moving else point.ZeroPoint
+            srect = self.rect
 
-            if selfvx > othervx or (self.x < other.x and self.rect.right > orect.left):
+            flags = 0
+            if svel.x > ovel.x or (self.x < other.x and srect.right > orect.left):
                 # this object is approaching from the left
                 # so its right edge will be colliding
-                _r = True
-                
-            if selfvx < othervx or (self.x > other.x and self.rect.left < orect.right):
+                flags |= Directions.RIGHT
+
+            if svel.x < ovel.x or (self.x > other.x and srect.left < orect.right):
                 # this object is approaching from the right
                 # so its left edge will be colliding
-                _l = True
+                flags |= Directions.LEFT
 
-            if selfvy > othervy or (self.y < other.y and self.rect.bottom > orect.top):
+            if svel.y > ovel.y or (self.y < other.y and srect.bottom > orect.top):
                 # this object is approaching from the top
                 # so its bottom will be colliding
-                _b = True
+                flags |= Directions.BOTTOM
 
-            if selfvy < othervy or (self.y > other.y and self.rect.top < orect.bottom):
+            if svel.y < ovel.y or (self.y > other.y and srect.top < orect.bottom):
                 # this object is approaching from the bottom
                 # so its top will be colliding
-                _t = True
-            
+                flags |= Directions.TOP
 
             if kill:
                 self.kill()
                 other.kill()
 
             # call this sprite's specific collision response method
-            return self.onCollision(other, Struct(left=_l, right=_r, top=_t, bottom=_b))
+            return self.onCollision(other, Directions.ALL[flags])
 
     def collideRect(self, otherrect):
         """Checks for collision against a rectangle.
@@ -716,30 +799,41 @@ class Image(Game.Sprite.DirtySprite):
     # These methods do nothing as they stand, because they are intended to be
     # overridden in derived classes. However, they still call super methods so
     # that we can make mixins that have specific collision responses.
-    # We wrap the super calls in a try/except, because pygame's Sprites don't
-    # have these methods.
+    # The metaclass works out which hooks are overridden (in _hooks) and
+    # which ones have a mixin after us in the MRO (in _chainedHooks), so we
+    # only call a hook or a super method if somebody implements it. The super
+    # calls are still wrapped in a try/except, because a mixin's own super
+    # call runs off the end of the chain (pygame's Sprites don't have these
+    # methods).
     ###
 
     def onCollision(self, other, directions=None):
         """Override this method for customized collision response.
 
            @param other: The object that collided with this object.
-           @param directions: A L{Struct} containing the directions where
-               collisions were detected (left, right, top, bottom).
+           @param directions: A L{Directions} object containing the directions
+               where collisions were detected (left, right, top, bottom).
            @return: Whether any collision response happened. This can be
                overriden in subclasses.
         """
         # don't do anything unless this sprite participates in collisions
         if self.collidable and self.alive:
-            if directions.left: self.hitLeft(other)
-            if directions.right: self.hitRight(other)
-            if directions.top: self.hitTop(other)
-            if directions.bottom: self.hitBottom(other)
-
-            try:
-                super(Image, self).onCollision(other, directions)
-            except AttributeError:
-                pass
+            hooks = self._hooks
+            if hooks:
+                if directions.left and 'hitLeft' in hooks:
+                    self.hitLeft(other)
+                if directions.right and 'hitRight' in hooks:
+                    self.hitRight(other)
+                if directions.top and 'hitTop' in hooks:
+                    self.hitTop(other)
+                if directions.bottom and 'hitBottom' in hooks:
+                    self.hitBottom(other)
+
+            if 'onCollision' in self._chainedHooks:
+                try:
+                    super(Image, self).onCollision(other, directions)
+                except AttributeError:
+                    pass
 
             return True
         else:
@@ -750,40 +844,80 @@ class Image(Game.Sprite.DirtySprite):
 
            @param other: The object colliding with this object.
         """
-        try:
-            super(Image, self).hitLeft(other)
-        except AttributeError:
-            pass
+        if 'hitLeft' in self._chainedHooks:
+            try:
+                super(Image, self).hitLeft(other)
+            except AttributeError:
+                pass
 
     def hitRight(self, other):
         """Collision response for a hit on the right side of the sprite.
 
            @param other: The object colliding with this object.
         """
-        try:
-            super(Image, self).hitRight(other)
-        except AttributeError:
-            pass
+        if 'hitRight' in self._chainedHooks:
+            try:
+                super(Image, self).hitRight(other)
+            except AttributeError:
+                pass
 
     def hitTop(self, other):
         """Collision response for a hit on the top of the sprite.
 
            @param other: The object colliding with this object.
         """
-        try:
-            super(Image, self).hitTop(other)
-        except AttributeError:
-            pass
+        if 'hitTop' in self._chainedHooks:
+            try:
+                super(Image, self).hitTop(other)
+            except AttributeError:
+                pass
 
     def hitBottom(self, other):
         """Collision response for a hit on the bottom of the sprite.
 
            @param other: The object colliding with this object.
         """
-        try:
-            super(Image, self).hitBottom(other)
-        except AttributeError:
-            pass
+        if 'hitBottom' in self._chainedHooks:
+            try:
+                super(Image, self).hitBottom(other)
+            except AttributeError:
+                pass
+
+    ###
+    # Tags
+    # A tag is a string used to find a set of objects (like "enemy" or
+    # "pickup"). The display list keeps track of which objects have each tag.
+    ###
+    def addTag(self, *tags):
+        """Adds one or more tags to this object."""
+        added = [t for t in tags if t not in self._tags]
+        if added:
+            self._tags.update(added)
+            self._retag(added, ())
+
+    def removeTag(self, *tags):
+        """Removes one or more tags from this object. Removing a tag that
+           the object doesn't have is harmless."""
+        removed = [t for t in tags if t in self._tags]
+        if removed:
+            self._tags.difference_update(removed)
+            self._retag((), removed)
+
+    def hasTag(self, tag):
+        """Tests whether this object has a tag."""
+        return tag in self._tags
+
+    @property
+    def tags(self):
+        """The tags of this object."""
+        return frozenset(self._tags)
+
+    def _retag(self, added, removed):
+        """Tells the groups that index tags about a change in this object's tags."""
+        for g in self.groups():
+            retagged = getattr(g, '_retagged', None)
+            if retagged is not None:
+                retagged(self, added, removed)
 
     ###
     # Getters and setters
@@ -834,6 +968,36 @@ class Image(Game.Sprite.DirtySprite):
     def bottom(self):
         return self.y + self.height/2.
 
+    # the name is indexed by the display list, so it needs to know of changes
+    def __get_name(self):
+        return self._name
+
+    def __set_name(self, val):
+        old = self._name
+        self._name = val
+        for g in self.groups():
+            renamed = getattr(g, '_renamed', None)
+            if renamed is not None:
+                renamed(self, old, val)
+
+    name = property(__get_name, __set_name, doc="The name of this object.")
+
+    # the display list draws sprites that don't scroll with the camera
+    # even when they're outside the view, so it needs to know of changes
+    def __get_scroll(self):
+        return self._scroll
+
+    def __set_scroll(self, val):
+        self._scroll = val
+        for g in self.groups():
+            rescrolled = getattr(g, '_rescrolled', None)
+            if rescrolled is not None:
+                rescrolled(self)
+
+    scroll = property(__get_scroll, __set_scroll,
+                      doc="""The camera scroll factor of this object. (To change
+                      it, set a new value; don't change its x or y directly.)""")
+
     # size properties
 
     def __get_width(self):
@@ -895,8 +1059,77 @@ class Image(Game.Sprite.DirtySprite):
     # Helper methods
     ###
     def _recenter(self):
-        """Moves a sprite into its proper screen-based position."""
-        self.rect.center = (self.screenX, self.screenY)
+        """Moves a sprite's rect to its position in the world."""
+        x, y = self._x, self._y
+        parent = self._parent
+        if parent is not None:
+            x += parent.x
+            y += parent.y
+        self.rect.center = (x, y)
+
+    def _touch(self):
+        """Tells the spatial indexes holding this sprite (and its children)
+           that it might have moved."""
+        for index in self._indexes:
+            index.touch(self)
+        for c in self._children:
+            if c._indexes:
+                c._touch()
+
+    def _rayHits(self, origin, direction, maxDistance, first=True):
+        """Tests this sprite against a ray, in world coordinates.
+
+           @return: A list holding a L{Struct} for the hit (with C{target},
+               C{distance}, and C{point} attributes), or an empty list.
+        """
+        x, y, left, top, right, bottom = self._worldBounds()
+        if self.shape is not None:
+            t = shape.intersectRay(self.shape, (x, y, self.angle), origin, direction)
+        else:
+            if hasattr(self, "hitbox"):
+                # the hitbox is relative to the rect
+                hb, r = self.hitbox, self.rect
+                left, top = left + hb.left - r.left, top + hb.top - r.top
+                right, bottom = left + hb.width, top + hb.height
+            t = shape.rayBox(origin[0], origin[1], direction[0], direction[1],
+                             left, top, right, bottom)
+
+        if t is None or t > maxDistance:
+            return []
+        return [Struct(target=self, distance=t,
+                       point=point.Vector(origin[0] + direction[0]*t,
+                                          origin[1] + direction[1]*t))]
+
+    def _worldBounds(self):
+        """Gets the world-space center and extent of this sprite (see
+           L{spatial.spriteBounds})."""
+        x, y = self.x, self.y
+        parent = self._parent
+        if parent is not None:
+            x += parent.x
+            y += parent.y
+        hw, hh = self.rect.width / 2., self.rect.height / 2.
+        return (x, y, x - hw, y - hh, x + hw, y + hh)
+
+    def _placement(self):
+        """Gets the placement (x, y, angle) of this sprite's collision shape,
+           in the same coordinates as its C{rect}."""
+        x, y = self.x, self.y
+        parent = self._parent
+        if parent is not None:
+            x += parent.x
+            y += parent.y
+        return (x, y, self.angle)
+
+    def _collisionShape(self):
+        """Gets this sprite's collision shape and its placement. A sprite
+           without a shape gets a box the size of its hitbox (or rect)."""
+        if self.shape is not None:
+            return self.shape, self._placement()
+        elif hasattr(self, "hitbox"):
+            return shape.fromRect(self.hitbox)
+        else:
+            return shape.fromRect(self.rect)
 
 class Entity(Image):
     """A movable game sprite.
@@ -935,6 +1168,8 @@ class Entity(Image):
 
        Subclasses of Entity can override the L{onMove}, L{onMoveX}, and L{onMoveY}
        "hooks" to create fine-grained motion control and collision detection/response.
+       Which hooks are overridden is worked out when the class is created, so
+       they must be defined in a class (or mixin), not assigned to an instance.
  
        The constructor arguments for L{Image} are all usable here.
 
@@ -949,7 +1184,19 @@ class Entity(Image):
            fairly expensive in terms of CPU, setting this to False is a minor
            optimization.
        @ivar fixed: Whether this object is affected by velocity and acceleration.
+       @ivar canSleep: Whether this object falls asleep by itself when it
+           isn't moving, rotating, or animating (see L{sleep}).
+       @ivar sleeping: Whether this object is asleep. (This is read-only; use
+           L{sleep} and L{wake} to change it.)
+
+       @keyword canSleep: Whether this object can fall asleep by itself.
     """
+    # Entities have a velocity (see Image.collide)
+    _moving = True
+
+    # motion hooks that do nothing unless overridden
+    _defaultHooks = ('onMove', 'onMoveX', 'onMoveY')
+
 ##    def __init__(self, x=0.0, y=0.0, w=0.0, h=0.0):
     def __init__(self, *args, **kwargs):
 ##        super(Entity, self).__init__(x,y,w,h)
@@ -983,6 +1230,10 @@ class Entity(Image):
         # does this sprite move?
         self.fixed = False
 
+        # sleeping sprites aren't updated
+        self._asleep = False
+        self.canSleep = kwargs.get('canSleep', False)
+
     # general methods
     def update(self):
         """Updates this sprite for the next frame."""
@@ -1004,7 +1255,10 @@ class Entity(Image):
                     else:
                         self.velocity.y = 0.0
 
-                self.velocity += self.acceleration * dt
+                # (only set things that change, so that an object that
+                # isn't moving isn't redrawn)
+                if self.acceleration:
+                    self.velocity += self.acceleration * dt
                 if self.maxVelocity is not None:
                     if self.velocity.x > self.maxVelocity.x:
                         self.velocity.x = self.maxVelocity.x
@@ -1012,12 +1266,19 @@ class Entity(Image):
                         self.velocity.y = self.maxVelocity.y
 
                 # move the entity, with hooks after moving by x and y
-                self.x += self.velocity.x * dt
-                self.onMoveX()
-                self.y += self.velocity.y * dt
-                self.onMoveY()
+                # (only the hooks that something overrides are called)
+                hooks = self._hooks
+                if self.velocity.x:
+                    self.x += self.velocity.x * dt
+                if 'onMoveX' in hooks:
+                    self.onMoveX()
+                if self.velocity.y:
+                    self.y += self.velocity.y * dt
+                if 'onMoveY' in hooks:
+                    self.onMoveY()
                 # hook for post-movement code (e.g., collision detection)
-                self.onMove()
+                if 'onMove' in hooks:
+                    self.onMove()
 
                 # rotation
                 # Setting angular velocity or acceleration overrides the
@@ -1030,32 +1291,73 @@ class Entity(Image):
                        self.maxAngularVelocity:
                         self.angularVelocity = self.maxAngularVelocity
                     self.angle += self.angularVelocity * dt
+                    self.redraw()
                     self.rect = self.image.get_rect()
 
         self._recenter()
         super(Entity, self).update()
 
+        if self.canSleep and not (self._velocity or self._accel or self._angular \
+                                  or self.angularAcceleration or self.animated):
+            self.sleep()
+
+    ###
+    # Sleeping
+    # A sleeping Entity is skipped by the display list's update, so it costs
+    # nothing until something wakes it up.
+    ###
+    def sleep(self):
+        """Puts this object to sleep. It won't be updated (so it won't move,
+           rotate, or animate) until L{wake} is called. Setting its velocity,
+           acceleration, or angular velocity (as a whole, not just the x or y
+           of a vector) also wakes it."""
+        if not self._asleep:
+            self._asleep = True
+            self._notifySleep()
+
+    def wake(self):
+        """Wakes this object up, so that it is updated every frame again."""
+        if self._asleep:
+            self._asleep = False
+            self._notifySleep()
+
+    @property
+    def sleeping(self):
+        """Whether this object is asleep."""
+        return self._asleep
+
+    def _notifySleep(self):
+        """Tells the groups that skip sleeping sprites about a change."""
+        for g in self.groups():
+            slept = getattr(g, '_slept', None)
+            if slept is not None:
+                slept(self)
+
     # per-frame update hooks
+    # (these are only called if a subclass or mixin overrides them)
     def onMove(self):
         """A hook for an Entity's post-movement actions."""
-        try:
-            super(Entity, self).onMove()
-        except AttributeError:
-            pass
+        if 'onMove' in self._chainedHooks:
+            try:
+                super(Entity, self).onMove()
+            except AttributeError:
+                pass
 
     def onMoveX(self):
         """A hook for actions taken after movement along the x axis."""
-        try:
-            super(Entity, self).onMoveX()
-        except AttributeError:
-            pass
+        if 'onMoveX' in self._chainedHooks:
+            try:
+                super(Entity, self).onMoveX()
+            except AttributeError:
+                pass
 
     def onMoveY(self):
         """A hook for actions taken after movement along the y axis."""
-        try:
-            super(Entity, self).onMoveY()
-        except AttributeError:
-            pass
+        if 'onMoveY' in self._chainedHooks:
+            try:
+                super(Entity, self).onMoveY()
+            except AttributeError:
+                pass
 
     # defining motion properties
     def _get_velocity(self):
@@ -1073,6 +1375,8 @@ class Entity(Image):
             self._velocity = point.Vector(_vx, _vy)
         else:
             self._velocity = point.Vector(val)
+        if self._asleep and self._velocity:
+            self.wake()
         self.redraw()
 
     velocity = property(_get_velocity, _set_velocity,
@@ -1083,6 +1387,8 @@ class Entity(Image):
 
     def _set_accel(self, val):
         self._accel = point.Vector(val)
+        if self._asleep and self._accel:
+            self.wake()
         self.redraw()
 
     acceleration = property(_get_accel, _set_accel,
@@ -1104,6 +1410,8 @@ class Entity(Image):
             self._angular = self.maxAngularVelocity * util.sign(val)
         else:
             self._angular = val
+        if self._asleep and self._angular:
+            self.wake()
         self.redraw()
 
     angularVelocity = property(_get_angularvelocity, _set_angularvelocity,
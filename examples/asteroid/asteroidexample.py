@@ -17,6 +17,7 @@ class Asteroid(Entity, mixin.Wrapper):
 
     def reset(self, position, velocity, size):
         self.load(['large.png','medium.png','small.png'][size])
+        self.shape = shape.Circle.fit(self)
         self.visible = True
         self.alive = True
         self.rotating = True
@@ -61,11 +62,6 @@ class Asteroid(Entity, mixin.Wrapper):
 
         return self
 
-    def update(self):
-        self.hitbox = self.rect.inflate(8,8)
-        self.mask = Game.Mask.from_surface(self.image)
-        super(Asteroid, self).update()
-
     def kill(self):
         if self.sizetype != Asteroid.SMALL:
 
@@ -136,11 +132,8 @@ class Ship(Entity, mixin.Wrapper):
     def reset(self):
         oldpos = self.position
         newpos = (random.randint(0,MAX_X), random.randint(0,MAX_Y))
-        asts = [a for a in Game.world.getEntities(Asteroid) if a.visible]
-        collided = False
-        for a in asts:
-            if a.rect.inflate(32,32).collidepoint(newpos):
-                collided = True
+        nearby = Game.world.getInRect((newpos[0]-16, newpos[1]-16, 32, 32), Asteroid)
+        collided = any(a.visible for a in nearby)
 
         if collided:
             newpos = self.reset()
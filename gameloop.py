@@ -3,7 +3,7 @@ from util import Struct
 ##from pygame.locals import *
 from pygame import fastevent as pgevent
 
-import point
+import point, spatial
 
 __doc__ = """A game object that contains a main loop
 
@@ -18,7 +18,7 @@ that can be used to perform the game logic. For scrolling games, use L{World}.
     singleton, and Game is the sole instance of the class.
 """
 
-__all__ = ['GameLoop', 'Game']
+__all__ = ['GameLoop', 'DisplayList', 'Game']
 
 class Globals(object):
     """Useful game-specific values.
@@ -42,6 +42,8 @@ class Globals(object):
         representing key codes, event types, display flags, etc.
     @cvar events: A Struct whose attributes point to the pygame events
         of the same name. (Example: event_types.KEYUP == pygame.KEYUP)
+    @cvar imageCache: A dictionary of images that have already been loaded
+        (usually by a L{Preloader}), by filename. See L{loadImage}.
     """
 
     @staticmethod
@@ -72,6 +74,20 @@ class Globals(object):
         from pygame import color
         return choice(color.THECOLORS.values())
 
+    @staticmethod
+    def loadImage(fname):
+        """Load an image from a file, unless it is in the image cache.
+
+           A cached image is copied instead of being decoded again, so each
+           caller gets its own surface that it can draw on.
+
+           @param fname: The filename of the image.
+        """
+        cached = Globals.imageCache.get(fname)
+        if cached is not None:
+            return cached.copy()
+        return pygame.image.load(fname)
+
     @staticmethod
     def timer(evttype, milliseconds=0):
         """Set an event timer.
@@ -114,6 +130,9 @@ class Globals(object):
     # Functions for loading/saving images
     Image = pygame.image
 
+    # Preloaded images, by filename
+    imageCache = {}
+
     # Functions for transforming (scaling, rotating, etc.) surfaces
     Transform = pygame.transform
 
@@ -147,6 +166,533 @@ class Globals(object):
 # Use the Game object to access "global" properties
 Game = Globals()
 
+class DisplayList(pygame.sprite.LayeredDirty):
+    """The sprite group used as a game's display list.
+
+       A L{DisplayList} is a pygame LayeredDirty group that also keeps its
+       sprites in a spatial index (a L{SpatialHash}), so that it can quickly
+       find the sprites in a particular area of the game world. The index is
+       updated whenever a sprite is added or removed (including by its C{kill}
+       method), and Pyrge sprites tell it when they move.
+
+       It also indexes its sprites by class (each sprite is listed under its
+       own class and all of that class's bases), by name, and by tag, so
+       looking up the sprites of one type takes time proportional to the
+       number found. Tag queries (L{tagged} and L{taggedAny}) combine the
+       sets for each tag, without looking at any other sprites.
+
+       If its C{view} is set, a DisplayList only draws the sprites that the
+       spatial index finds in that part of the world, plus any that it can't
+       cull: those with a scroll factor other than (1,1), since they aren't
+       drawn where they are in the world, and sprites that aren't Pyrge
+       objects. Before culling, sprites that make their parts as they come
+       into view (such as a L{TileMap}'s chunks) are told which part of the
+       world is about to be drawn, by calling their C{_prepareView} method
+       with the view (or None, if everything will be drawn).
+
+       @ivar spatial: The L{SpatialHash} holding this group's sprites.
+       @ivar view: A Rect, in world coordinates, outside of which sprites
+           aren't drawn, or None to draw everything. (A L{World} sets this
+           to the camera's view every frame.)
+       @ivar camera: The position of the camera (the world coordinates of the
+           top-left corner of the screen), or None. Sprite rects are in world
+           coordinates, and are only moved to the screen (according to their
+           scroll factors) while they're being drawn. (A L{GameLoop} sets
+           this to C{Game.scroll} every frame.)
+       @ivar scrollBlit: If True, when the camera moves, the last frame is
+           scrolled by the camera's movement and only the newly exposed edges
+           and the sprites that changed are redrawn, instead of the whole
+           screen. This only works if the background is a solid color (or
+           is covered by sprites), since the background doesn't scroll. It
+           isn't used while there are any parallax layers.
+       @ivar parallax: A list of L{ParallaxLayer}s, drawn back to front as
+           the background behind all of the sprites. They are composited
+           onto the background surface only when the camera (or one of the
+           layers) moves.
+       @ivar activity: The activity regions used by L{update}, as a tuple
+           (center, near, mid, rate), or None to update every sprite. (A
+           L{World} sets this from its C{setActivityRegions} settings.)
+
+       @keyword cellsize: The size of the spatial index's grid cells.
+    """
+    def __init__(self, *sprites, **kwargs):
+        self.spatial = spatial.SpatialHash(kwargs.pop('cellsize', 64))
+
+        # class -> set of sprites that are instances of it
+        self._byType = {}
+
+        # name -> set of sprites with that name
+        self._byName = {}
+
+        # tag -> set of sprites with that tag
+        self._byTag = {}
+
+        # the area of the world to draw (None means everything)
+        self.view = None
+
+        # sprites that are drawn even when they're outside the view
+        self._unculled = set()
+
+        # sprites that only draw the part of themselves that is on the screen
+        self._windowed = set()
+
+        # sprites that make their parts as they come into view
+        self._viewDependent = set()
+
+        # the sprites drawn in the last culled frame
+        self._drawn = set()
+
+        # the regions of the world where sprites are updated
+        self.activity = None
+        self._frame = 0
+
+        # sleeping sprites, which aren't updated
+        self._sleeping = set()
+
+        # the camera position when the last frame was drawn
+        self.camera = None
+        self._lastCamera = None
+        self._lastOffset = None
+        self._lastSurface = None
+
+        # scroll the last frame instead of redrawing everything
+        self.scrollBlit = False
+
+        # parallax layers, and the background they were last composited on
+        self.parallax = []
+        self._backdrop = None
+        self._backdropKey = None
+        self._backdropBase = None
+
+        # the order of sprites within a layer, so that a culled set
+        # can be put back into drawing order without the full list
+        self._sequence = {}
+        self._nextSequence = 0
+
+        super(DisplayList, self).__init__(*sprites, **kwargs)
+
+    def ofType(self, etype):
+        """Gets the sprites that are instances of a class (or its subclasses).
+
+           @param etype: A class, or a tuple of classes (as for C{isinstance}).
+           @return: A list of sprites, in no particular order.
+        """
+        if isinstance(etype, tuple):
+            found = set()
+            for t in etype:
+                found.update(self._byType.get(t, ()))
+            return list(found)
+        return list(self._byType.get(etype, ()))
+
+    def named(self, name):
+        """Gets the sprites with a given name.
+
+           @return: A list of sprites, in no particular order.
+        """
+        return list(self._byName.get(name, ()))
+
+    def tagged(self, tags, exclude=None):
+        """Gets the sprites that have all of the given tags.
+
+           @param tags: A tag, or a sequence of tags.
+           @param exclude: A tag, or a sequence of tags. Sprites with any of
+               these are left out.
+           @return: A set of sprites.
+        """
+        sets = sorted(self._tagSets(tags), key=len)
+        if not sets or not sets[0]:
+            return set()
+        found = set(sets[0])
+        for members in sets[1:]:
+            found.intersection_update(members)
+        return self._exclude(found, exclude)
+
+    def taggedAny(self, tags, exclude=None):
+        """Gets the sprites that have at least one of the given tags.
+
+           @param tags: A tag, or a sequence of tags.
+           @param exclude: A tag, or a sequence of tags. Sprites with any of
+               these are left out.
+           @return: A set of sprites.
+        """
+        return self._exclude(set().union(*self._tagSets(tags)), exclude)
+
+    def update(self, *args):
+        """Updates the sprites, as C{Group.update}, except for sleeping sprites
+           and those outside the activity regions.
+
+           If C{activity} is set, sprites with any part within C{near}
+           pixels of its C{center} are updated every frame. Those out to
+           C{mid} pixels are updated every C{rate} frames (each on a different
+           frame, to spread the load), with C{Game.elapsed} multiplied by the
+           rate so that they move at the right speed. Sprites farther away
+           are frozen until they're in range again. Sprites that don't scroll
+           with the camera are always updated. The C{center} can also be a
+           list of points (one for each viewport of a split screen), in which
+           case the regions around all of them are active.
+        """
+        activity = self.activity
+        sleeping = self._sleeping
+        if activity is None and not sleeping:
+            return super(DisplayList, self).update(*args)
+
+        reduced = []
+        if activity is None:
+            active = [spr for spr in self._spritelist if spr not in sleeping]
+        else:
+            center, near, mid, rate = activity
+            centers = center if isinstance(center, list) else (center,)
+            nearby = set(self._unculled)
+            for center in centers:
+                nearby.update(self.spatial.touchingRadius(center, near))
+            nearby.difference_update(sleeping)
+            if mid is not None:
+                self._frame += 1
+                frame, sequence = self._frame, self._sequence
+                reduced = set()
+                for center in centers:
+                    for spr in self.spatial.touchingRadius(center, mid):
+                        if spr not in nearby and spr not in sleeping and \
+                           (sequence[spr] + frame) % rate == 0:
+                            reduced.add(spr)
+            active = self._inDrawingOrder(nearby)
+
+        for spr in active:
+            spr.update(*args)
+        if reduced:
+            elapsed = Game.elapsed
+            Game.elapsed = elapsed * rate
+            try:
+                for spr in self._inDrawingOrder(reduced):
+                    spr.update(*args)
+            finally:
+                Game.elapsed = elapsed
+
+    def draw(self, surface, bgd=None):
+        """Draws the sprites in the view (or all of them, if there is no
+           view), as C{LayeredDirty.draw}, moved by the camera."""
+        for spr in list(self._viewDependent):
+            spr._prepareView(self.view)
+        allsprites = self._spritelist
+        if self.view is not None:
+            self._spritelist = self._visibleSprites(self.view)
+        scrolled = self._followCamera(surface)
+        if self.parallax:
+            self._drawParallax(surface)
+        moved = self._toScreen(self._spritelist)
+        moved.extend(self._toWindows(surface))
+        try:
+            rects = super(DisplayList, self).draw(surface, bgd)
+        finally:
+            self._spritelist = allsprites
+            for spr, rect in reversed(moved):
+                spr.rect = rect
+            self._lastSurface = surface
+
+        if scrolled is not None:
+            # the whole picture has moved
+            rects = [scrolled]
+        return rects
+
+    def set_clip(self, screen_rect=None):
+        super(DisplayList, self).set_clip(screen_rect)
+
+        # the last frame was drawn somewhere else, so it can't be scrolled
+        self._lastOffset = None
+
+    def change_layer(self, sprite, new_layer):
+        super(DisplayList, self).change_layer(sprite, new_layer)
+
+        # a sprite moved to a new layer goes on top of that layer
+        self._sequence[sprite] = self._nextSequence
+        self._nextSequence += 1
+
+    def add_internal(self, sprite, layer=None):
+        super(DisplayList, self).add_internal(sprite, layer)
+
+        # new sprites go on top of their layer
+        self._sequence[sprite] = self._nextSequence
+        self._nextSequence += 1
+
+        for cls in sprite.__class__.__mro__:
+            _indexAdd(self._byType, cls, sprite)
+        self._renamed(sprite, None, getattr(sprite, 'name', None))
+        self._retagged(sprite, getattr(sprite, '_tags', ()), ())
+
+        if getattr(sprite, '_windowed', False):
+            self._windowed.add(sprite)
+        if getattr(sprite, '_viewDependent', False):
+            self._viewDependent.add(sprite)
+
+        # only Pyrge sprites know how to report their movements
+        indexes = getattr(sprite, '_indexes', None)
+        if indexes is not None:
+            self.spatial.insert(sprite)
+            indexes.append(self.spatial)
+            self._rescrolled(sprite)
+            self._slept(sprite)
+        else:
+            self._unculled.add(sprite)
+
+    def remove_internal(self, sprite):
+        super(DisplayList, self).remove_internal(sprite)
+
+        for cls in sprite.__class__.__mro__:
+            _indexDiscard(self._byType, cls, sprite)
+        self._renamed(sprite, getattr(sprite, 'name', None), None)
+        self._retagged(sprite, (), getattr(sprite, '_tags', ()))
+
+        del self._sequence[sprite]
+        self._unculled.discard(sprite)
+        self._windowed.discard(sprite)
+        self._viewDependent.discard(sprite)
+        self._drawn.discard(sprite)
+        self._sleeping.discard(sprite)
+
+        indexes = getattr(sprite, '_indexes', None)
+        if indexes is not None:
+            self.spatial.remove(sprite)
+            while self.spatial in indexes:
+                indexes.remove(self.spatial)
+
+    def _renamed(self, sprite, old, new):
+        """Moves a sprite in the name index. Pyrge sprites call this when
+           their name changes."""
+        if old is not None:
+            _indexDiscard(self._byName, old, sprite)
+        if new is not None:
+            _indexAdd(self._byName, new, sprite)
+
+    def _retagged(self, sprite, added, removed):
+        """Updates the tag index for a sprite. Pyrge sprites call this when
+           their tags change."""
+        for tag in removed:
+            _indexDiscard(self._byTag, tag, sprite)
+        for tag in added:
+            _indexAdd(self._byTag, tag, sprite)
+
+    def _rescrolled(self, sprite):
+        """Checks whether a sprite can be culled. Pyrge sprites call this
+           when their scroll factor changes."""
+        scroll = sprite.scroll
+        if scroll.x == 1 and scroll.y == 1:
+            self._unculled.discard(sprite)
+        else:
+            self._unculled.add(sprite)
+
+    def _visibleSprites(self, view):
+        """Gets the sprites to draw for a view, in drawing order."""
+        visible = set(self.spatial.inRect(view))
+        visible.update(self._unculled)
+
+        # Sprites that have just left the view won't be drawn, so pygame
+        # won't clear their old positions; we have to do that ourselves.
+        # They're marked dirty so they're drawn in full when they come back.
+        olds = self.spritedict
+        for spr in self._drawn.difference(visible):
+            old = olds.get(spr)
+            if old is not None and old is not self._init_rect:
+                self.lostsprites.append(old)
+                olds[spr] = self._init_rect
+            if spr.dirty == 0:
+                spr.dirty = 1
+        self._drawn = visible
+
+        return self._inDrawingOrder(visible)
+
+    def _inDrawingOrder(self, sprites):
+        """Sorts some of this group's sprites into drawing order."""
+        layers, sequence = self._spritelayers, self._sequence
+        return sorted(sprites, key=lambda spr: (layers[spr], sequence[spr]))
+
+    def _slept(self, sprite):
+        """Checks whether a sprite is asleep. Pyrge sprites call this when
+           they fall asleep or wake up."""
+        if getattr(sprite, '_asleep', False):
+            self._sleeping.add(sprite)
+        else:
+            self._sleeping.discard(sprite)
+
+    def _followCamera(self, surface):
+        """Works out how to redraw the screen after the camera moves.
+
+           Everything that scrolls has moved on the screen, so unless the
+           last frame can be scrolled to match (see C{scrollBlit}), redrawing
+           all of it is quicker than finding what changed.
+
+           @return: The area of the surface that was scrolled, or None.
+        """
+        camera = self.camera
+        if camera is None:
+            return None
+        cx, cy = camera[0], camera[1]
+        if (cx, cy) == self._lastCamera:
+            return None
+
+        offset = (int(round(cx)), int(round(cy)))
+        last = self._lastOffset
+        self._lastCamera = (cx, cy)
+        self._lastOffset = offset
+
+        clip = self._clip or surface.get_clip()
+        if (self.scrollBlit and not self.parallax and last is not None and
+            surface is self._lastSurface):
+            dx, dy = offset[0] - last[0], offset[1] - last[1]
+            if abs(dx) < clip.width and abs(dy) < clip.height:
+                self._scrollScreen(surface, clip, dx, dy)
+                return clip
+
+        self._use_update = False
+        return None
+
+    def _drawParallax(self, surface):
+        """Composites the parallax layers onto the background that the
+           sprites are drawn over. This is only done when something has
+           moved, and then the whole screen has to be redrawn."""
+        backdrop = self._backdrop
+        base = self._bgd
+        if base is backdrop:
+            base = self._backdropBase
+        self._backdropBase = base
+
+        size = surface.get_size()
+        if backdrop is None or backdrop.get_size() != size:
+            backdrop = self._backdrop = pygame.Surface(size, 0, surface)
+            self._backdropKey = None
+
+        # only the area being drawn needs the layers
+        clip = self._clip or surface.get_clip()
+        backdrop.set_clip(clip)
+
+        camera = self.camera or (0,0)
+        layers = tuple((id(layer), layer.visible, layer.position(camera))
+                       for layer in self.parallax)
+        key = (id(base), tuple(clip)) + layers
+        if key != self._backdropKey:
+            if base is not None:
+                backdrop.blit(base, (0,0))
+            else:
+                backdrop.fill((0,0,0))
+            for layer in self.parallax:
+                layer.draw(backdrop, camera)
+            self._backdropKey = key
+            self._use_update = False
+
+        self._bgd = backdrop
+
+    def _scrollScreen(self, surface, clip, dx, dy):
+        """Scrolls the last frame to follow a camera move of (dx,dy) pixels,
+           and marks what needs to be redrawn."""
+        if dx or dy:
+            oldclip = surface.get_clip()
+            surface.set_clip(clip)
+            surface.scroll(-dx, -dy)
+            surface.set_clip(oldclip)
+
+            # what was drawn last frame has moved with it
+            olds = self.spritedict
+            drawn = self._drawn if self.view is not None else self._spritelist
+            for spr in drawn:
+                old = olds.get(spr)
+                if old is not None and old is not self._init_rect:
+                    old.move_ip(-dx, -dy)
+            lost = self.lostsprites
+            for rect in lost:
+                rect.move_ip(-dx, -dy)
+
+            # the edges that scrolled into view need drawing
+            if dx > 0:
+                lost.append(pygame.Rect(clip.right - dx, clip.top, dx, clip.height))
+            elif dx < 0:
+                lost.append(pygame.Rect(clip.left, clip.top, -dx, clip.height))
+            if dy > 0:
+                lost.append(pygame.Rect(clip.left, clip.bottom - dy, clip.width, dy))
+            elif dy < 0:
+                lost.append(pygame.Rect(clip.left, clip.top, clip.width, -dy))
+
+        # sprites that don't scroll with the camera are now in the wrong place
+        for spr in self._unculled:
+            if spr.dirty == 0:
+                spr.dirty = 1
+
+        self._use_update = True
+
+    def _toScreen(self, sprites):
+        """Moves the rects of sprites from world to screen coordinates, so
+           that they can be drawn.
+
+           @return: A list of (sprite, world rect) pairs, to be put back
+               after drawing.
+        """
+        camera = self.camera
+        if camera is None:
+            return []
+        cx, cy = camera[0], camera[1]
+        if not (cx or cy):
+            return []
+
+        moved = []
+        for spr in sprites:
+            # only Pyrge sprites have scroll factors
+            scroll = getattr(spr, 'scroll', None)
+            if scroll is not None:
+                dx, dy = int(round(cx * scroll.x)), int(round(cy * scroll.y))
+                if dx or dy:
+                    rect = spr.rect
+                    moved.append((spr, rect))
+                    spr.rect = rect.move(-dx, -dy)
+        return moved
+
+    def _toWindows(self, surface):
+        """Shrinks the (screen) rects of windowed sprites to the part of the
+           surface being drawn, and tells them to show that part of
+           themselves. A windowed sprite has a C{_showArea} method, which
+           takes the area to show (relative to its top-left corner) and sets
+           up its C{image} to match.
+
+           @return: A list of (sprite, rect) pairs, to be put back after
+               drawing.
+        """
+        if not self._windowed:
+            return []
+        clip = self._clip or surface.get_clip()
+        moved = []
+        for spr in self._windowed:
+            rect = spr.rect
+            area = rect.clip(clip)
+            moved.append((spr, rect))
+            spr._showArea(area.move(-rect.x, -rect.y))
+            spr.rect = area
+        return moved
+
+    def _tagSets(self, tags):
+        """Gets the index sets for one or more tags."""
+        if isinstance(tags, basestring):
+            tags = (tags,)
+        return [self._byTag.get(t, ()) for t in tags]
+
+    def _exclude(self, found, exclude):
+        """Removes the sprites with any of the excluded tags from a set."""
+        if exclude is not None and found:
+            for members in self._tagSets(exclude):
+                found.difference_update(members)
+        return found
+
+def _indexAdd(index, key, sprite):
+    """Adds a sprite to the set for a key in an index dictionary."""
+    members = index.get(key)
+    if members is None:
+        members = index[key] = set()
+    members.add(sprite)
+
+def _indexDiscard(index, key, sprite):
+    """Removes a sprite from the set for a key, dropping empty sets."""
+    members = index.get(key)
+    if members is not None:
+        members.discard(sprite)
+        if not members:
+            del index[key]
+
 class GameLoop(object):
     """An event-aware wrapper around the basic pygame loop.
 
@@ -278,7 +824,7 @@ class GameLoop(object):
         self.background = pygame.Surface((self.width, self.height))
 
         # This is the "display list": all the drawable objects
-        self._entities = pygame.sprite.LayeredDirty()
+        self._entities = DisplayList()
         self.addUpdater(self.update)
 
         # the game can set this to pause the game logic,
@@ -296,21 +842,174 @@ class GameLoop(object):
         return self
 
     def getEntities(self, etype=None):
-        """Get all the entities in the display list, or those of a specific type"""
+        """Get all the entities in the display list, or those of a specific type.
+
+           @param etype: A class, or a string to get the entities with that
+               name. If this is given, the entities are looked up in the
+               display list's indexes and come back in no particular order;
+               otherwise, all entities are returned in drawing order.
+        """
         if etype is not None:
             if isinstance(etype, basestring):
-                es = [_e for _e in self._entities if _e.name == etype]
+                es = self._entities.named(etype)
             else:
-                es = [_e for _e in self._entities if isinstance(_e, etype)]
+                es = self._entities.ofType(etype)
         else:
             es = self._entities.sprites()
 
         return es
 
+    def getTagged(self, tags, exclude=None):
+        """Get the entities that have all of the given tags.
+
+           For example, C{getTagged(('enemy', 'flying'), exclude='boss')}
+           finds every flying enemy that isn't a boss.
+
+           @param tags: A tag, or a sequence of tags.
+           @param exclude: A tag, or a sequence of tags to leave out.
+           @return: A set of entities.
+        """
+        return self._entities.tagged(tags, exclude)
+
+    def getTaggedAny(self, tags, exclude=None):
+        """Get the entities that have any of the given tags.
+
+           @param tags: A tag, or a sequence of tags.
+           @param exclude: A tag, or a sequence of tags to leave out.
+           @return: A set of entities.
+        """
+        return self._entities.taggedAny(tags, exclude)
+
+    ###
+    # Spatial queries
+    # These use the display list's spatial index, so they don't have to look
+    # at every sprite. All positions are in world coordinates.
+    ###
+    def getNearest(self, pos, count=1, etype=None, layers=None, maxDistance=None):
+        """Get the entities closest to a point, closest first.
+
+           @param pos: The point to search from.
+           @param count: The maximum number of entities to return.
+           @param etype: If given, only entities of this type (or with this
+               name, if it is a string) are returned, as in L{getEntities}.
+           @param layers: If given, only entities whose C{collisionLayers}
+               have one of these bits set are returned.
+           @param maxDistance: If given, entities farther away are ignored.
+        """
+        return self._entities.spatial.nearest(pos, count,
+                                              self._queryFilter(etype, layers),
+                                              maxDistance)
+
+    def getWithinRadius(self, pos, radius, etype=None, layers=None):
+        """Get the entities whose centers are within a distance of a point.
+
+           @param pos: The center of the search.
+           @param radius: The search distance.
+           @param etype: If given, only entities of this type (or name).
+           @param layers: If given, only entities on these collision layers.
+        """
+        return self._entities.spatial.withinRadius(pos, radius,
+                                                   self._queryFilter(etype, layers))
+
+    def getInRect(self, rect, etype=None, layers=None):
+        """Get the entities that overlap a rectangle.
+
+           @param rect: The area to search, as a Rect or (x, y, w, h).
+           @param etype: If given, only entities of this type (or name).
+           @param layers: If given, only entities on these collision layers.
+        """
+        return self._entities.spatial.inRect(rect,
+                                             self._queryFilter(etype, layers))
+
+    def raycast(self, start, direction, maxDistance=None, etype=None,
+                layers=None, ignore=None):
+        """Find the first entity hit by a ray.
+
+           Only collidable entities can be hit. Entities with a C{shape} are
+           tested against it (the shape should fit inside the entity's rect,
+           since only the rect is indexed); others are tested against their
+           bounding box.
+
+           @param start: The start of the ray.
+           @param direction: The direction of the ray (any length but zero).
+           @param maxDistance: The length of the ray, or None for no limit.
+           @param etype: If given, only entities of this type (or name).
+           @param layers: If given, only entities on these collision layers.
+           @param ignore: An entity, or a sequence of them, that the ray
+               passes through (such as the one casting it).
+           @return: A L{Struct} with C{target}, C{distance}, and C{point}
+               attributes, or None if nothing was hit. (A L{TileMap} target
+               adds C{tile} and C{index}.)
+        """
+        hits = self._castRay(start, direction, maxDistance, etype, layers,
+                             ignore, True)
+        return hits[0] if hits else None
+
+    def raycastAll(self, start, direction, maxDistance=None, etype=None,
+                   layers=None, ignore=None):
+        """Find all the entities hit by a ray, closest first.
+
+           The arguments are the same as for L{raycast}.
+
+           @return: A list of hits, as returned by L{raycast}.
+        """
+        return self._castRay(start, direction, maxDistance, etype, layers,
+                             ignore, False)
+
+    def segmentCast(self, start, end, etype=None, layers=None, ignore=None):
+        """Find the first entity hit by a line segment. This can be used as
+           a line-of-sight test, since it returns None if the way is clear.
+
+           @param start: One end of the segment, where the search begins.
+           @param end: The other end of the segment.
+        """
+        direction = point.Vector(end) - start
+        return self.raycast(start, direction, direction.length(), etype,
+                            layers, ignore)
+
+    def segmentCastAll(self, start, end, etype=None, layers=None, ignore=None):
+        """Find all the entities hit by a line segment, closest first."""
+        direction = point.Vector(end) - start
+        return self.raycastAll(start, direction, direction.length(), etype,
+                               layers, ignore)
+
+    def _castRay(self, start, direction, maxDistance, etype, layers, ignore, first):
+        """Helper for the ray casting methods."""
+        accept = self._queryFilter(etype, layers)
+        if ignore is None:
+            ignore = ()
+        elif isinstance(ignore, pygame.sprite.Sprite):
+            ignore = (ignore,)
+
+        def test(e, origin, direction, maxd, first):
+            if not e.collidable or e in ignore or \
+               (accept is not None and not accept(e)):
+                return ()
+            return e._rayHits(origin, direction, maxd, first)
+
+        return self._entities.spatial.castRay(start,
+                                              point.Vector(direction).normalized(),
+                                              test, maxDistance, first)
+
+    def _queryFilter(self, etype, layers):
+        """Helper to make the filter function for a spatial query."""
+        if etype is None and layers is None:
+            return None
+        elif layers is None:
+            if isinstance(etype, basestring):
+                return lambda e: e.name == etype
+            else:
+                return lambda e: isinstance(e, etype)
+        elif etype is None:
+            return lambda e: e.collisionLayers & layers
+        elif isinstance(etype, basestring):
+            return lambda e: e.name == etype and e.collisionLayers & layers
+        else:
+            return lambda e: isinstance(e, etype) and e.collisionLayers & layers
+
     def update(self):
         self._entities.update()
-        self._entities.clear(self.screen, self.background)
-        self._rectList = self._entities.draw(self.screen)
+        self._rectList = self._draw()
 
         if self.scale != 1:
             if self.scale == 2:
@@ -323,6 +1022,27 @@ class GameLoop(object):
                 r.w *= self.scale
                 r.h *= self.scale
 
+    def _draw(self):
+        """Draws the display list onto the screen.
+
+           @return: A list of the Rects of the screen that were changed.
+        """
+        self._entities.camera = Game.scroll
+        self._entities.clear(self.screen, self.background)
+        return self._entities.draw(self.screen)
+
+    def screenToWorld(self, pos, scroll=(1,1)):
+        """Finds the position in the world shown at a point on the screen.
+
+           @param pos: A position on the screen, as an (x,y) tuple, before
+               the game's graphics are scaled (so a mouse position must be
+               divided by C{scale} first).
+           @param scroll: The scroll factor of the sprites being looked for.
+           @return: A L{Point} in world coordinates.
+        """
+        return point.Point(pos[0] + Game.scroll.x * scroll[0],
+                           pos[1] + Game.scroll.y * scroll[1])
+
     def addHandler(self, evttype, func):
         """Add a handler for a specific type of event"""
         if not isinstance(evttype, int) or evttype > pygame.NUMEVENTS:
@@ -376,6 +1096,9 @@ class GameLoop(object):
     def __set_bgcolor(self, color):
         self.background.fill(color)
 
+        # parallax layers have to be composited onto the new color
+        self._entities._backdropKey = None
+
     backgroundColor = property(__get_bgcolor, __set_bgcolor, \
                                doc="The background color of the game screen.")
 
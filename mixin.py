@@ -83,7 +83,13 @@ class Clickable(SpriteMixin):
         @todo: This should take into account layers, and whether there is
                another object on top of this one.
         """
-        pos = (event.pos[0] / Game.world.scale, event.pos[1] / Game.world.scale)
+        # sprite rects are in world coordinates
+        world = Game.world
+        pos = world.screenToWorld((event.pos[0] / world.scale,
+                                   event.pos[1] / world.scale), self.scroll)
+        if pos is None:
+            # the click missed every viewport
+            return
         if (hasattr(self, "hitbox") and self.hitbox.collidepoint(pos)) or \
            self.rect.collidepoint(pos) and self.alive:
             self.click(event)
@@ -0,0 +1,150 @@
+import pygame
+from gameloop import Game
+
+__doc__ = """Pre-rendered parallax backgrounds
+
+The L{parallax} module contains the L{ParallaxLayer} class, a scrolling
+background picture that isn't a sprite. A game's display list draws its
+parallax layers (back to front) as the background behind all of its sprites,
+so they never take part in updating, collision, or dirty-rect tracking. This
+makes them much cheaper than building a background out of sprites with custom
+scroll factors, especially when there are several layers.
+
+Layers are added to a L{World} with its C{addParallaxLayer} method."""
+
+__all__ = ['ParallaxLayer']
+
+class ParallaxLayer(object):
+    """A background picture that scrolls at its own rate.
+
+       The picture is drawn with its top-left corner at its C{offset},
+       moved by the camera position times the layer's scroll factor. A
+       factor of 0 keeps the layer fixed to the screen, 1 scrolls it with the
+       world, and anything in between makes it look farther away.
+
+       A layer that wraps is repeated forever in that direction. A small
+       wrapping picture is tiled (once) until it is at least as large as the
+       screen, so that drawing a layer never takes more than four blits.
+
+       @param surface: The picture, as a pygame Surface or a filename.
+       @keyword scroll: The scroll factor, as a number or an (x,y) pair. The
+           default is 0.5.
+       @keyword offset: The world position of the picture's top-left corner
+           when the camera is at (0,0).
+       @keyword wrapX: Whether the picture repeats horizontally (the default
+           is True).
+       @keyword wrapY: Whether the picture repeats vertically (the default is
+           False).
+
+       @ivar scroll: The scroll factor, as an (x,y) tuple.
+       @ivar offset: The position of the picture, as an (x,y) tuple.
+       @ivar visible: Whether this layer is drawn.
+    """
+    def __init__(self, surface, **kwargs):
+        if isinstance(surface, basestring):
+            surface = Game.loadImage(surface)
+        self._source = surface
+
+        scroll = kwargs.get('scroll', 0.5)
+        if not hasattr(scroll, '__getitem__'):
+            scroll = (scroll, scroll)
+        self.scroll = (scroll[0], scroll[1])
+
+        offset = kwargs.get('offset', (0,0))
+        self.offset = (offset[0], offset[1])
+
+        self.wrapX = kwargs.get('wrapX', True)
+        self.wrapY = kwargs.get('wrapY', False)
+        self.visible = True
+
+        # the picture as it is drawn, made the first time it's needed
+        self._picture = None
+        self._pictureFor = None
+
+    @classmethod
+    def fromImages(cls, images, size=None, **kwargs):
+        """Creates a layer by compositing a number of sprites into a single
+           picture. The sprites' positions (their C{rect}s) are used as the
+           positions in the picture, and they are drawn in the order given.
+
+           @param images: A sequence of L{Image}s.
+           @param size: The size of the picture. If this is None, it is just
+               big enough for all the images.
+           @return: A new ParallaxLayer. Any keyword arguments are passed on
+               to the constructor.
+        """
+        rects = [i.rect for i in images]
+        if size is None:
+            bounds = rects[0].unionall(rects[1:])
+            size = (bounds.right, bounds.bottom)
+        surface = pygame.Surface(size, pygame.SRCALPHA, 32)
+        for i in images:
+            surface.blit(i.image, i.rect)
+        return cls(surface, **kwargs)
+
+    def position(self, camera):
+        """Gets the on-screen position of the picture's top-left corner.
+
+           @param camera: The camera position, as an (x,y) pair.
+        """
+        return (int(round(self.offset[0] - camera[0] * self.scroll[0])),
+                int(round(self.offset[1] - camera[1] * self.scroll[1])))
+
+    def draw(self, surface, camera):
+        """Draws this layer onto a surface.
+
+           @param surface: The surface to draw on (usually the screen).
+           @param camera: The camera position, as an (x,y) pair.
+           @return: The number of blits that were needed.
+        """
+        if not self.visible:
+            return 0
+
+        picture = self._prepare(surface)
+        w, h = picture.get_size()
+        px, py = self.position(camera)
+
+        if self.wrapX:
+            px %= w
+            xs = (px - w, px) if px else (0,)
+        else:
+            xs = (px,)
+        if self.wrapY:
+            py %= h
+            ys = (py - h, py) if py else (0,)
+        else:
+            ys = (py,)
+
+        blit = surface.blit
+        for y in ys:
+            for x in xs:
+                blit(picture, (x, y))
+        return len(xs) * len(ys)
+
+    def _prepare(self, surface):
+        """Gets the picture to draw onto a surface, converting it to the
+           surface's format and tiling it to cover the surface if needed."""
+        size = surface.get_size()
+        if self._picture is not None and self._pictureFor == size:
+            return self._picture
+
+        source = self._source
+        w, h = source.get_size()
+        tw = w * -(-size[0] // w) if self.wrapX else w
+        th = h * -(-size[1] // h) if self.wrapY else h
+        if (tw, th) != (w, h):
+            tiled = pygame.Surface((tw, th), source.get_flags(), source)
+            for y in xrange(0, th, h):
+                for x in xrange(0, tw, w):
+                    tiled.blit(source, (x, y))
+            source = tiled
+
+        # a converted surface is much faster to blit
+        if pygame.display.get_surface() is not None:
+            if source.get_flags() & pygame.SRCALPHA:
+                source = source.convert_alpha()
+            else:
+                source = source.convert()
+
+        self._picture, self._pictureFor = source, size
+        return source
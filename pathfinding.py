@@ -0,0 +1,787 @@
+import heapq, math
+from array import array
+from collections import OrderedDict, deque
+from point import Point, Vector
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__doc__ = """Finding paths through tile maps
+
+The L{pathfinding} module contains the L{PathFinder}, which finds paths
+between the cells of a L{TileMap}, going around its solid tiles. It searches
+the map's solidity grid directly (the same one used for collisions), and keeps
+the paths it has found, so agents asking for the same path don't search again.
+The kept paths (and the jump-point data) are thrown away whenever a tile edit
+changes which cells are solid.
+
+Searches can be run at once, with L{PathFinder.findPath}, or queued with
+L{PathFinder.request}. Queued searches are run a little at a time, as the map
+updates, with a limit on the number of nodes looked at in each frame; a game
+with many agents finding paths takes a few frames longer to find them all,
+instead of stopping for a long search.
+
+Paths are lists of (column, row) cells, from the start to the goal.
+L{PathFinder.worldPath} turns them into the world positions of the cells'
+centers, for sprites to follow.
+
+When many agents are heading for the same place (a swarm of enemies chasing
+the player, say), a L{FlowField} is cheaper than a path for each of them. It
+finds the way to one goal from every cell of the map at once, and any agent
+can then look up which way to go from where it is."""
+
+__all__ = ['FlowField', 'PathFinder', 'PathRequest']
+
+_SQRT2 = math.sqrt(2)
+_INF = float('inf')
+
+# (column step, row step, cost) for each move
+_STRAIGHT = ((1,0,1), (-1,0,1), (0,1,1), (0,-1,1))
+_DIAGONAL = ((1,1,_SQRT2), (-1,1,_SQRT2), (1,-1,_SQRT2), (-1,-1,_SQRT2))
+
+def _sign(n):
+    return (n > 0) - (n < 0)
+
+def _cellAt(tilemap, x, y):
+    """Gets the (column, row) of the cell of a map under a point in the
+       world. (It may be outside the map.)"""
+    left, top = tilemap._worldBounds()[2:4]
+    return (int((x - left) // tilemap.sheet.spritewidth),
+            int((y - top) // tilemap.sheet.spriteheight))
+
+def _padGrid(tilemap):
+    """Makes a copy of a map's solidity grid with a border of solid cells
+       around it, so the neighbors of any cell in the map can be looked at
+       without checking the edges.
+
+       @return: The padded grid (a bytearray) and its width.
+    """
+    grid, cols, rows = tilemap._solidity(), tilemap.columns, tilemap.rows
+    width = cols + 2
+    pad = bytearray('\x01') * (width * (rows + 2))
+    for row in xrange(rows):
+        start = (row + 1) * width + 1
+        pad[start:start + cols] = grid[row*cols:(row + 1)*cols]
+    return pad, width
+
+class PathRequest(object):
+    """A path asked for with L{PathFinder.request}.
+
+       @ivar start: The (column, row) of the start cell.
+       @ivar goal: The (column, row) of the goal cell.
+       @ivar path: The path (a list of cells from the start to the goal), or
+           None if there isn't one or the search hasn't finished.
+       @ivar done: Whether the search has finished.
+       @ivar callback: A function called with this request when it's done, or
+           None.
+    """
+    def __init__(self, start, goal, callback=None):
+        self.start = (int(start[0]), int(start[1]))
+        self.goal = (int(goal[0]), int(goal[1]))
+        self.callback = callback
+        self.path = None
+        self.done = False
+
+        # the running search (a generator), if it has been started
+        self._search = None
+
+    @property
+    def found(self):
+        """Whether a path was found."""
+        return self.path is not None
+
+    def _finish(self, path):
+        self.path = path
+        self.done = True
+        self._search = None
+
+class PathFinder(object):
+    """Finds paths through a L{TileMap}, around its solid tiles.
+
+       Two searches are available: A* and jump-point search (JPS). JPS finds
+       the same (shortest) paths as A* on a map with diagonal moves, but it
+       skips over open areas instead of putting every cell in them on the
+       open list. Where each straight jump ends is kept along with the paths,
+       so later searches (from anywhere) don't scan the same rows and columns
+       again. JPS can only be used with diagonal moves.
+
+       Diagonal moves never cut the corner of a solid tile: both of the cells
+       beside the move have to be clear.
+
+       A pathfinder is updated along with its map, so queued requests are
+       worked on while the map is in the world. L{update} can also be called
+       directly. The map only holds a weak reference to it, so a pathfinder
+       that isn't used any more goes away by itself; L{close} stops it
+       straight away.
+
+       @param tilemap: The L{TileMap} to find paths through.
+       @keyword diagonal: Whether paths can move diagonally. (The default is
+           True.)
+       @keyword method: The search to use: C{'jps'} (the default, when
+           diagonal moves are allowed) or C{'astar'}.
+       @keyword nodesPerFrame: The most nodes looked at by queued searches in
+           each frame. For JPS, each cell passed over while jumping counts as
+           a node, the first time it is jumped over. (The default is 2000.)
+       @keyword cacheSize: The most paths that are kept. (The default is 256.)
+
+       @ivar tilemap: The map this pathfinder searches.
+    """
+    def __init__(self, tilemap, **kwargs):
+        self.tilemap = tilemap
+        self.diagonal = kwargs.get('diagonal', True)
+        self.method = kwargs.get('method', 'jps' if self.diagonal else 'astar')
+        self.nodesPerFrame = kwargs.get('nodesPerFrame', 2000)
+        self.cacheSize = kwargs.get('cacheSize', 256)
+
+        if self.method not in ('astar', 'jps'):
+            raise ValueError, "Unknown search method %r" % (self.method,)
+        if self.method == 'jps' and not self.diagonal:
+            raise ValueError, "Jump-point search needs diagonal moves"
+
+        # (start, goal) -> path, in the order they were last used
+        self._cache = OrderedDict()
+
+        # the map's solidity changes when the cache was last checked
+        self._version = tilemap._solidVersion
+
+        self._queue = deque()
+
+        # navigation data for JPS: the solidity grid with a border, and
+        # (cell, step) -> where a straight jump from that cell ends, filled
+        # in as searches need them
+        self._padded = None
+        self._jumps = {}
+
+        tilemap._pathFinders.add(self)
+
+    def close(self):
+        """Stops this pathfinder from being updated with its map. Any queued
+           requests are dropped."""
+        self.tilemap._pathFinders.discard(self)
+        self._queue.clear()
+
+    def findPath(self, start, goal):
+        """Finds a path between two cells right away, however long it takes.
+
+           @param start: The (column, row) of the start cell.
+           @param goal: The (column, row) of the goal cell.
+           @return: A list of the (column, row) cells along the path,
+               including the start and goal, or None if there is no path.
+        """
+        request = PathRequest(start, goal)
+        if not self._fromCache(request):
+            for work in self._search(request):
+                pass
+            self._store(request)
+        return request.path
+
+    def request(self, start, goal, callback=None):
+        """Asks for a path between two cells. The search is run a little at a
+           time by L{update}, unless the path is already known.
+
+           @param start: The (column, row) of the start cell.
+           @param goal: The (column, row) of the goal cell.
+           @param callback: A function to call with the request once the
+               search has finished.
+           @return: A L{PathRequest}, which holds the path when it's done.
+        """
+        request = PathRequest(start, goal, callback)
+        if self._fromCache(request):
+            self._done(request)
+        else:
+            self._queue.append(request)
+        return request
+
+    def cancel(self, request):
+        """Stops a queued search.
+
+           @param request: A L{PathRequest} from L{request}.
+        """
+        try:
+            self._queue.remove(request)
+        except ValueError:
+            pass
+        request._search = None
+
+    @property
+    def pending(self):
+        """The number of queued searches that haven't finished."""
+        return len(self._queue)
+
+    def clearCache(self):
+        """Throws away all the kept paths and jump-point data."""
+        self._cache.clear()
+        self._padded = None
+        self._jumps.clear()
+
+    def update(self):
+        """Runs the queued searches, until they are done or the frame's limit
+           of nodes is reached."""
+        self._checkVersion()
+        budget = self.nodesPerFrame
+        queue = self._queue
+        while queue and budget > 0:
+            request = queue[0]
+            if request._search is None:
+                if self._fromCache(request):
+                    queue.popleft()
+                    self._done(request)
+                    continue
+                request._search = self._search(request)
+            try:
+                budget -= request._search.next()
+            except StopIteration:
+                queue.popleft()
+                self._store(request)
+                self._done(request)
+
+    def cellAt(self, x, y):
+        """Gets the (column, row) of the cell of the map under a point in the
+           world. (It may be outside the map.)"""
+        return _cellAt(self.tilemap, x, y)
+
+    def worldPath(self, path):
+        """Gets the world positions of the centers of a path's cells.
+
+           @param path: A list of (column, row) cells, as returned by
+               L{findPath}.
+           @return: A list of L{Point}s.
+        """
+        left, top = self.tilemap._worldBounds()[2:4]
+        tw, th = self.tilemap.sheet.spritewidth, self.tilemap.sheet.spriteheight
+        return [Point(left + (col + 0.5) * tw, top + (row + 0.5) * th)
+                for col, row in path]
+
+    ### The path cache
+
+    def _checkVersion(self):
+        """Throws away the kept paths (and restarts the running searches) if
+           a tile edit has changed the map's solidity."""
+        version = self.tilemap._solidVersion
+        if version != self._version:
+            self._version = version
+            self._cache.clear()
+            self._padded = None
+            self._jumps.clear()
+            for request in self._queue:
+                request._search = None
+
+    def _fromCache(self, request):
+        """Finishes a request with a kept path, if there is one.
+
+           @return: Whether the path was kept.
+        """
+        self._checkVersion()
+        key = (request.start, request.goal)
+        if key not in self._cache:
+            return False
+        path = self._cache.pop(key)
+        self._cache[key] = path
+        request._finish(list(path) if path is not None else None)
+        return True
+
+    def _store(self, request):
+        path = request.path
+        self._cache[(request.start, request.goal)] = \
+            tuple(path) if path is not None else None
+        while len(self._cache) > self.cacheSize:
+            self._cache.popitem(last=False)
+
+    def _done(self, request):
+        if request.callback is not None:
+            request.callback(request)
+
+    ### Searches
+
+    def _search(self, request):
+        """Searches for a request's path, yielding the number of nodes looked
+           at every so often. The request is finished when it's done."""
+        tilemap = self.tilemap
+        grid, cols, rows = tilemap._solidity(), tilemap.columns, tilemap.rows
+
+        start, goal = request.start, request.goal
+        for c, r in (start, goal):
+            if not (0 <= c < cols and 0 <= r < rows) or grid[r*cols + c]:
+                request._finish(None)
+                return
+
+        if self.method == 'jps':
+            search = self._jumpPointSearch(request, grid, cols, rows)
+        else:
+            search = self._aStar(request, grid, cols, rows)
+        for work in search:
+            yield work
+
+    def _heuristic(self, c, r, goal):
+        dc, dr = abs(goal[0] - c), abs(goal[1] - r)
+        if self.diagonal:
+            # the octile distance
+            return dc + dr + (_SQRT2 - 2) * min(dc, dr)
+        return dc + dr
+
+    def _aStar(self, request, grid, cols, rows):
+        start, goal = request.start, request.goal
+        moves = _STRAIGHT + _DIAGONAL if self.diagonal else _STRAIGHT
+        heuristic = self._heuristic
+
+        cost = {start: 0}
+        parent = {start: None}
+        closed = set()
+        heap = [(heuristic(start[0], start[1], goal), 0, start)]
+        while heap:
+            f, g, node = heapq.heappop(heap)
+            if node in closed:
+                # an old entry for a node that was reached more cheaply
+                continue
+            g = -g
+            if node == goal:
+                request._finish(self._trace(parent, node))
+                return
+            closed.add(node)
+
+            c, r = node
+            for dc, dr, step in moves:
+                nc, nr = c + dc, r + dr
+                if not (0 <= nc < cols and 0 <= nr < rows) or grid[nr*cols + nc]:
+                    continue
+                if dc and dr and (grid[r*cols + nc] or grid[nr*cols + c]):
+                    continue
+                neighbor = (nc, nr)
+                ng = g + step
+                if neighbor not in closed and ng < cost.get(neighbor, ng + 1):
+                    cost[neighbor] = ng
+                    parent[neighbor] = node
+                    # ties go to the node farthest along
+                    heapq.heappush(heap, (ng + heuristic(nc, nr, goal), -ng, neighbor))
+            yield 1
+
+        request._finish(None)
+
+    def _jumpPointSearch(self, request, grid, cols, rows):
+        start, goal = request.start, request.goal
+        heuristic = self._heuristic
+
+        # cells are numbered in a copy of the grid with a solid border, so
+        # the neighbors of any cell in the map can be looked at directly
+        if self._padded is None:
+            self._padded = _padGrid(self.tilemap)
+        pad, width = self._padded
+        jumps = self._jumps
+        goalCell = (goal[1] + 1) * width + goal[0] + 1
+
+        def jumpStraight(i, step, side):
+            # moves along a row or column until a cell with a forced neighbor
+            if pad[i]:
+                return None, 0
+            end, scanned = jumps.get((i, step)), 1
+            if end is None:
+                # every cell on the way leads to the same place
+                cells = []
+                j = i
+                while True:
+                    cells.append((j, step))
+                    forced = ((not pad[j - side] and pad[j - side - step]) or
+                              (not pad[j + side] and pad[j + side - step]))
+                    if forced or pad[j + step]:
+                        end = (j, forced)
+                        break
+                    j += step
+                for key in cells:
+                    jumps[key] = end
+                scanned = len(cells)
+
+            # the goal stops a jump that passes over it
+            last, forced = end
+            offset = goalCell - i
+            if 0 <= offset // step <= (last - i) // step and offset % step == 0:
+                return goalCell, scanned
+            return (last if forced else None), scanned
+
+        def jump(i, dc, dr):
+            if not (dc and dr):
+                return jumpStraight(i, dc + dr * width, dr + dc * width)
+            # a diagonal move stops where a straight jump from it would
+            step, scanned = dc + dr * width, 0
+            while not pad[i]:
+                scanned += 1
+                if i == goalCell:
+                    return i, scanned
+                for straight, side in ((dc, width), (dr * width, 1)):
+                    found, n = jumpStraight(i + straight, straight, side)
+                    scanned += n
+                    if found is not None:
+                        return i, scanned
+                if pad[i + dc] or pad[i + dr * width]:
+                    break
+                i += step
+            return None, scanned
+
+        def neighbors(i, dc, dr):
+            # the directions worth jumping in, moving in a direction
+            if dc and dr:
+                sideR, sideC = not pad[i + dr * width], not pad[i + dc]
+                moves = []
+                if sideR:
+                    moves.append((0, dr))
+                if sideC:
+                    moves.append((dc, 0))
+                if sideR and sideC:
+                    moves.append((dc, dr))
+                return moves
+            # across the direction of travel
+            ac, ar = dr, dc
+            moves = []
+            sideA = not pad[i + ac + ar * width]
+            sideB = not pad[i - ac - ar * width]
+            if not pad[i + dc + dr * width]:
+                moves.append((dc, dr))
+                if sideA:
+                    moves.append((dc + ac, dr + ar))
+                if sideB:
+                    moves.append((dc - ac, dr - ar))
+            if sideA:
+                moves.append((ac, ar))
+            if sideB:
+                moves.append((-ac, -ar))
+            return moves
+
+        cost = {start: 0}
+        parent = {start: None}
+        closed = set()
+        heap = [(heuristic(start[0], start[1], goal), 0, start)]
+        while heap:
+            f, g, node = heapq.heappop(heap)
+            if node in closed:
+                continue
+            g = -g
+            if node == goal:
+                request._finish(self._fill(self._trace(parent, node)))
+                return
+            closed.add(node)
+
+            c, r = node
+            i = (r + 1) * width + c + 1
+            if parent[node] is None:
+                # the start: every move is worth trying
+                moves = [(dc, dr) for dc, dr, step in _STRAIGHT + _DIAGONAL
+                         if not pad[i + dc + dr * width] and
+                            not (dc and dr and (pad[i + dc] or pad[i + dr * width]))]
+            else:
+                pc, pr = parent[node]
+                moves = neighbors(i, _sign(c - pc), _sign(r - pr))
+
+            work = 1
+            for dc, dr in moves:
+                found, scanned = jump(i + dc + dr * width, dc, dr)
+                work += scanned
+                if found is None:
+                    continue
+                found = (found % width - 1, found // width - 1)
+                if found in closed:
+                    continue
+                dc, dr = abs(found[0] - c), abs(found[1] - r)
+                ng = g + max(dc, dr) + (_SQRT2 - 1) * min(dc, dr)
+                if ng < cost.get(found, ng + 1):
+                    cost[found] = ng
+                    parent[found] = node
+                    heapq.heappush(heap, (ng + heuristic(found[0], found[1], goal),
+                                          -ng, found))
+            yield work
+
+        request._finish(None)
+
+    @staticmethod
+    def _trace(parent, node):
+        """Follows the parents of a node back to the start, giving the path
+           from the start to that node."""
+        path = []
+        while node is not None:
+            path.append(node)
+            node = parent[node]
+        path.reverse()
+        return path
+
+    @staticmethod
+    def _fill(points):
+        """Fills in the cells between the jump points of a path, which are
+           always in a straight or diagonal line."""
+        path = points[:1]
+        for c1, r1 in points[1:]:
+            c, r = path[-1]
+            dc, dr = _sign(c1 - c), _sign(r1 - r)
+            while (c, r) != (c1, r1):
+                c += dc
+                r += dr
+                path.append((c, r))
+        return path
+
+class FlowField(object):
+    """The way to one goal from every cell of a L{TileMap}.
+
+       A flow field holds the distance from each cell to the goal (going
+       around solid tiles), and the direction to move in from each cell to
+       get closer to it. Looking up the direction for an agent takes the same
+       short time however big the map is, so any number of agents can share
+       one field.
+
+       The distances are found with Dijkstra's algorithm. If NumPy is
+       installed, the search works on the whole frontier of cells at once,
+       and the directions are kept in arrays; otherwise, each direction is
+       worked out from the distances when it is looked up.
+
+       When the goal moves, the field is updated from the old one: every
+       distance starts as the old distance plus the distance between the old
+       and new goals (which is never too short), and only the cells that are
+       closer than that to the new goal are looked at again. A field is
+       updated along with its map, and found again from scratch when a tile
+       edit changes which cells are solid. (The map only holds a weak
+       reference to the field, so one that isn't used any more goes away by
+       itself; L{close} stops it straight away.)
+
+       @param tilemap: The L{TileMap} the field covers.
+       @param goal: The (column, row) of the goal cell, or None to set it
+           later with L{setGoal}.
+       @keyword diagonal: Whether agents can move diagonally. (The default is
+           True.) Diagonal moves never cut the corner of a solid tile.
+
+       @ivar tilemap: The map the field covers.
+       @ivar goal: The (column, row) of the goal cell.
+    """
+    def __init__(self, tilemap, goal=None, **kwargs):
+        self.tilemap = tilemap
+        self.diagonal = kwargs.get('diagonal', True)
+        self.goal = None
+
+        # (offset, cost, side, side) for each move in the padded grid; a
+        # diagonal move needs both of the cells at its sides to be clear
+        self._moves = None
+
+        # the padded solidity grid, the distances to the goal for each cell
+        # in it, and (with NumPy) each cell's direction
+        self._pad = None
+        self._width = 0
+        self._distance = None
+        self._dirX = self._dirY = None
+
+        self._version = None
+
+        if goal is not None:
+            self.setGoal(goal)
+        tilemap._pathFinders.add(self)
+
+    def close(self):
+        """Stops this field from being updated with its map."""
+        self.tilemap._pathFinders.discard(self)
+
+    def setGoal(self, goal):
+        """Moves the goal of the field.
+
+           @param goal: The (column, row) of the new goal cell.
+        """
+        goal = (int(goal[0]), int(goal[1]))
+        if self._version != self.tilemap._solidVersion or self._distance is None:
+            self.goal = goal
+            self._build()
+        elif goal != self.goal:
+            self._move(goal)
+
+    def setGoalAt(self, x, y):
+        """Moves the goal of the field to the cell under a point in the world.
+        """
+        self.setGoal(_cellAt(self.tilemap, x, y))
+
+    def update(self):
+        """Finds the field again if the map's solid tiles have changed."""
+        if self.goal is not None and self._version != self.tilemap._solidVersion:
+            self._build()
+
+    def distance(self, col, row):
+        """Gets the distance (in cells) from a cell to the goal.
+
+           @return: The distance, or None if the goal can't be reached from
+               that cell (or it is outside the map).
+        """
+        if self._distance is None or not self._inMap(col, row):
+            return None
+        d = self._distance[(row + 1) * self._width + col + 1]
+        return float(d) if d != _INF else None
+
+    def direction(self, col, row):
+        """Gets the direction to move in from a cell to get closer to the
+           goal.
+
+           @return: A unit L{Vector}, or a zero vector at the goal, in a cell
+               the goal can't be reached from, or outside the map.
+        """
+        if self._distance is None or not self._inMap(col, row):
+            return Vector(0, 0)
+        if self._dirX is not None:
+            return Vector(float(self._dirX[row, col]), float(self._dirY[row, col]))
+
+        # worked out from the neighbors' distances
+        dist, pad = self._distance, self._pad
+        i = (row + 1) * self._width + col + 1
+        if dist[i] in (0, _INF):
+            return Vector(0, 0)
+        best, move = _INF, None
+        for offset, cost, side1, side2, dc, dr in self._moves:
+            n = i + offset
+            if pad[n] or (side1 and (pad[i + side1] or pad[i + side2])):
+                continue
+            if dist[n] + cost < best:
+                best, move = dist[n] + cost, (dc, dr)
+        if move is None:
+            return Vector(0, 0)
+        return Vector(move[0], move[1]).normalized()
+
+    def steer(self, x, y):
+        """Gets the direction to move in from a point in the world, to get
+           closer to the goal.
+
+           @return: A unit L{Vector}, or a zero vector (see L{direction}).
+        """
+        col, row = _cellAt(self.tilemap, x, y)
+        return self.direction(col, row)
+
+    def _inMap(self, col, row):
+        return 0 <= col < self.tilemap.columns and 0 <= row < self.tilemap.rows
+
+    ### Finding the distances
+
+    def _build(self):
+        """Finds the whole field from scratch."""
+        tilemap = self.tilemap
+        self._version = tilemap._solidVersion
+        self._pad, width = _padGrid(tilemap)
+        self._width = width
+
+        moves = []
+        for dc, dr, cost in _STRAIGHT + (_DIAGONAL if self.diagonal else ()):
+            sides = (dc, dr * width) if dc and dr else (0, 0)
+            moves.append((dc + dr * width, cost) + sides + (dc, dr))
+        self._moves = moves
+
+        size = len(self._pad)
+        if numpy is not None:
+            blocked = numpy.frombuffer(bytes(self._pad), numpy.uint8).astype(bool)
+            # which moves can be made from each cell
+            allowed = numpy.empty((size, len(moves)), bool)
+            for k, (offset, cost, side1, side2, dc, dr) in enumerate(moves):
+                allowed[:,k] = ~numpy.roll(blocked, -offset)
+                if side1:
+                    allowed[:,k] &= ~numpy.roll(blocked, -side1)
+                    allowed[:,k] &= ~numpy.roll(blocked, -side2)
+            self._allowed = allowed
+            self._distance = numpy.empty(size)
+            self._distance.fill(_INF)
+        else:
+            self._distance = array('d', [_INF]) * size
+
+        col, row = self.goal
+        if self._inMap(col, row) and not self._pad[(row + 1) * width + col + 1]:
+            start = (row + 1) * width + col + 1
+            self._distance[start] = 0
+            self._relax([start])
+
+        if numpy is not None:
+            rows, cols = tilemap.rows, tilemap.columns
+            self._dirX = numpy.zeros((rows, cols), numpy.float32)
+            self._dirY = numpy.zeros((rows, cols), numpy.float32)
+            self._findDirections(0, rows, 0, cols)
+
+    def _move(self, goal):
+        """Updates the field for a new goal, starting from the old one."""
+        old, self.goal = self.distance(goal[0], goal[1]), goal
+        if old is None:
+            # no path between the goals, so the old field is no help
+            self._build()
+            return
+
+        dist = self._distance
+        start = (goal[1] + 1) * self._width + goal[0] + 1
+        if numpy is not None:
+            before = dist.copy()
+            dist += old
+            dist[start] = 0
+            self._relax(numpy.array([start]))
+
+            # the directions can only change around the cells that changed
+            # (the rows and columns here are those of the padded grid)
+            changed = (dist != before + old).reshape(-1, self._width)
+            rows = numpy.flatnonzero(changed.any(axis=1))
+            cols = numpy.flatnonzero(changed.any(axis=0))
+            self._findDirections(max(rows[0] - 2, 0), rows[-1],
+                                 max(cols[0] - 2, 0), cols[-1])
+        else:
+            for i in xrange(len(dist)):
+                dist[i] += old
+            dist[start] = 0
+            self._relax([start])
+
+    def _relax(self, frontier):
+        """Lowers the distances of the cells reachable from a list of cells
+           (whose distances have just been lowered), until none can be lowered
+           any further."""
+        dist, moves = self._distance, self._moves
+        if numpy is not None:
+            # one step of every cell in the frontier at a time
+            offsets = numpy.array([m[0] for m in moves])
+            costs = numpy.array([m[1] for m in moves])
+            allowed = self._allowed
+            frontier = numpy.asarray(frontier)
+            while frontier.size:
+                neighbors = frontier[:,None] + offsets
+                candidates = dist[frontier][:,None] + costs
+                ok = allowed[frontier]
+                neighbors, candidates = neighbors[ok], candidates[ok]
+                better = candidates < dist[neighbors]
+                neighbors, candidates = neighbors[better], candidates[better]
+                numpy.minimum.at(dist, neighbors, candidates)
+                frontier = numpy.unique(neighbors)
+        else:
+            pad = self._pad
+            heap = [(dist[i], i) for i in frontier]
+            heapq.heapify(heap)
+            while heap:
+                d, i = heapq.heappop(heap)
+                if d > dist[i]:
+                    continue
+                for offset, cost, side1, side2, dc, dr in moves:
+                    n = i + offset
+                    if pad[n] or (side1 and (pad[i + side1] or pad[i + side2])):
+                        continue
+                    if d + cost < dist[n]:
+                        dist[n] = d + cost
+                        heapq.heappush(heap, (d + cost, n))
+
+    def _findDirections(self, r0, r1, c0, c1):
+        """Finds the directions of the cells in rows C{r0} to C{r1} and
+           columns C{c0} to C{c1} (inclusive)."""
+        r1 = min(r1, self.tilemap.rows - 1)
+        c1 = min(c1, self.tilemap.columns - 1)
+        if r0 > r1 or c0 > c1:
+            return
+        width = self._width
+        dist = self._distance.reshape(-1, width)
+        allowed = self._allowed.reshape(dist.shape + (len(self._moves),))
+
+        inner = (slice(r0 + 1, r1 + 2), slice(c0 + 1, c1 + 2))
+        best = numpy.empty(dist[inner].shape)
+        best.fill(_INF)
+        dirX = numpy.zeros(best.shape, numpy.float32)
+        dirY = numpy.zeros(best.shape, numpy.float32)
+        for k, (offset, cost, side1, side2, dc, dr) in enumerate(self._moves):
+            neighbor = dist[r0 + 1 + dr:r1 + 2 + dr, c0 + 1 + dc:c1 + 2 + dc] + cost
+            closer = allowed[inner + (k,)] & (neighbor < best)
+            length = math.hypot(dc, dr)
+            best[closer] = neighbor[closer]
+            dirX[closer] = dc / length
+            dirY[closer] = dr / length
+
+        # the goal, and the cells it can't be reached from, have no direction
+        stay = (dist[inner] == 0) | (dist[inner] == _INF)
+        dirX[stay] = dirY[stay] = 0
+        self._dirX[r0:r1 + 1, c0:c1 + 1] = dirX
+        self._dirY[r0:r1 + 1, c0:c1 + 1] = dirY
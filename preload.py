@@ -0,0 +1,119 @@
+import threading, pygame
+from gameloop import Game
+
+__doc__ = """Loading assets in the background
+
+The L{Preloader} loads images (and runs any other loading tasks) on a worker
+thread while the game keeps running, so that the next level or menu can be
+started without a pause. Loaded images are put into C{Game.imageCache}, where
+C{Game.loadImage} (and so every Pyrge method that loads an image) finds them
+without decoding them again.
+
+A L{Stage} keeps a list of the assets it needs, and a L{World} can preload a
+stage with its C{preloadStage} method."""
+
+__all__ = ['Preloader']
+
+class Preloader(object):
+    """Loads a list of assets on a worker thread.
+
+       Images are decoded and converted to the display's pixel format (if the
+       display has been set up) on the worker thread. Other tasks are called
+       there, and their return values kept in C{results}.
+
+       @param images: A sequence of image filenames.
+
+       @ivar results: The return values of the tasks that have finished, in
+           the order they were added (see L{addTask}).
+       @ivar error: The exception raised by a failed task, or None. Loading
+           stops at the first failure.
+    """
+    def __init__(self, images=()):
+        self._tasks = []
+        self._finished = 0
+        self._thread = None
+        self._done = threading.Event()
+        self.results = []
+        self.error = None
+
+        for fname in images:
+            self.addImage(fname)
+
+    def addImage(self, fname, alpha=None):
+        """Adds an image to be loaded.
+
+           @param fname: The filename of the image.
+           @param alpha: Whether to keep the image's per-pixel transparency
+               when converting it. If None, it is kept if the image has any.
+           @return: This object, for chaining.
+        """
+        return self.addTask(self._loadImage, fname, alpha)
+
+    def addTask(self, func, *args):
+        """Adds a loading function, which will be called with the given
+           arguments on the worker thread. It must not touch the game's
+           sprites, since they are being used by the main thread.
+
+           @param func: A function.
+           @return: This object, for chaining.
+        """
+        if self._thread is not None:
+            raise RuntimeError, "Preloader has already been started"
+        self._tasks.append((func, args))
+        return self
+
+    def start(self):
+        """Starts loading. Calling this more than once does nothing.
+
+           @return: This object, for chaining.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Waits until loading is finished, starting it if needed.
+
+           @param timeout: The longest time (in seconds) to wait, or None to
+               wait for as long as it takes.
+           @return: Whether loading is finished.
+        """
+        self.start()
+        self._done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.done
+
+    @property
+    def progress(self):
+        """How much of the loading has finished, from 0.0 to 1.0."""
+        if not self._tasks:
+            return 1.0
+        return float(self._finished) / len(self._tasks)
+
+    @property
+    def done(self):
+        """Whether loading is finished (successfully or not)."""
+        return self._done.is_set()
+
+    def _run(self):
+        try:
+            for func, args in self._tasks:
+                self.results.append(func(*args))
+                self._finished += 1
+        except Exception, e:
+            self.error = e
+        finally:
+            self._done.set()
+
+    @staticmethod
+    def _loadImage(fname, alpha):
+        surface = pygame.image.load(fname)
+        if pygame.display.get_surface() is not None:
+            if alpha is None:
+                alpha = surface.get_flags() & pygame.SRCALPHA
+            surface = surface.convert_alpha() if alpha else surface.convert()
+        Game.imageCache[fname] = surface
+        return surface
@@ -0,0 +1,470 @@
+import math
+from pygame import Rect
+
+__doc__ = """Collision shapes
+
+The L{shape} module contains simple geometric shapes that can be given to
+a sprite (as its C{shape} attribute) to make its collision detection more
+accurate than a bounding box, while being much cheaper than a pixel mask.
+There are four shapes: L{Circle}, L{AABB} (an axis-aligned box, which does not
+rotate), L{OrientedBox} (a box that rotates with its sprite), and L{Polygon}
+(any convex polygon, tested with the separating axis theorem).
+
+Shapes are defined relative to the center of their sprite, so one shape object
+can be shared by any number of sprites. The L{overlap} function tests two
+placed shapes against each other, using a specialized test for each pair of
+shape types, and L{intersectRay} finds where a ray first hits a shape."""
+
+__all__ = ['Shape', 'Circle', 'AABB', 'OrientedBox', 'Polygon', 'overlap',
+           'intersectRay', 'rayBox', 'clipRay', 'fromRect']
+
+class Shape(object):
+    """The base class for collision shapes. You shouldn't make instances of
+       this class; use a subclass instead.
+
+       @ivar offset: The position of the shape's center relative to the
+           center of its sprite, as an (x,y) tuple.
+    """
+
+    # the index of this type of shape in the pair test table
+    kind = None
+
+    def __init__(self, offset=(0,0)):
+        self.offset = (float(offset[0]), float(offset[1]))
+
+    def center(self, x, y, angle=0.0):
+        """Gets the center of this shape when its sprite is at (x,y) and
+           rotated by C{angle} degrees."""
+        ox, oy = self.offset
+        if not (ox or oy):
+            return x, y
+        c, s = _cossin(angle)
+        return x + ox*c + oy*s, y - ox*s + oy*c
+
+    def bounds(self, x, y, angle=0.0):
+        """Gets a Rect containing this shape when its sprite is at (x,y) and
+           rotated by C{angle} degrees. This is abstract; every subclass
+           must override it.
+
+           @return: A pygame Rect bounding the placed shape.
+        """
+        raise NotImplementedError, "Shape subclasses must implement bounds()"
+
+class Circle(Shape):
+    """A circular collision shape.
+
+       @param radius: The radius of the circle, in pixels.
+       @param offset: The position of the circle's center relative to its sprite.
+    """
+    kind = 0
+
+    def __init__(self, radius, offset=(0,0)):
+        super(Circle, self).__init__(offset)
+        self.radius = float(radius)
+
+    @classmethod
+    def fit(cls, image, scale=1.0):
+        """Creates a circle that fits inside an image's (unrotated) bitmap.
+
+           @param image: The L{Image} to fit.
+           @param scale: A factor applied to the radius (e.g., 0.9 for a
+               slightly smaller circle).
+        """
+        w, h = image.pixels.get_size()
+        return cls(min(w, h) / 2. * scale)
+
+    def bounds(self, x, y, angle=0.0):
+        cx, cy = self.center(x, y, angle)
+        r = self.radius
+        return Rect(int(math.floor(cx - r)), int(math.floor(cy - r)),
+                    int(math.ceil(2*r)) + 1, int(math.ceil(2*r)) + 1)
+
+class AABB(Shape):
+    """An axis-aligned box. This box never rotates, even if its sprite does.
+
+       @param width: The width of the box.
+       @param height: The height of the box.
+       @param offset: The position of the box's center relative to its sprite.
+    """
+    kind = 1
+
+    def __init__(self, width, height, offset=(0,0)):
+        super(AABB, self).__init__(offset)
+        self.halfwidth = width / 2.
+        self.halfheight = height / 2.
+
+    @classmethod
+    def fit(cls, image, scale=1.0):
+        """Creates a box the same size as an image's (unrotated) bitmap."""
+        w, h = image.pixels.get_size()
+        return cls(w * scale, h * scale)
+
+    def center(self, x, y, angle=0.0):
+        # an AABB doesn't rotate, so neither does its offset
+        return x + self.offset[0], y + self.offset[1]
+
+    def extents(self, x, y, angle=0.0):
+        """Gets the edges of the placed box as (left, top, right, bottom)."""
+        cx, cy = x + self.offset[0], y + self.offset[1]
+        return (cx - self.halfwidth, cy - self.halfheight,
+                cx + self.halfwidth, cy + self.halfheight)
+
+    def vertices(self, x, y, angle=0.0):
+        """Gets the four corners of the placed box."""
+        l, t, r, b = self.extents(x, y)
+        return ((l,t), (r,t), (r,b), (l,b))
+
+    def bounds(self, x, y, angle=0.0):
+        l, t, r, b = self.extents(x, y)
+        return Rect(int(math.floor(l)), int(math.floor(t)),
+                    int(math.ceil(r - l)) + 1, int(math.ceil(b - t)) + 1)
+
+class OrientedBox(Shape):
+    """A box that rotates along with its sprite.
+
+       @param width: The width of the box (before rotation).
+       @param height: The height of the box (before rotation).
+       @param offset: The position of the box's center relative to its sprite.
+    """
+    kind = 2
+
+    def __init__(self, width, height, offset=(0,0)):
+        super(OrientedBox, self).__init__(offset)
+        self.halfwidth = width / 2.
+        self.halfheight = height / 2.
+
+    @classmethod
+    def fit(cls, image, scale=1.0):
+        """Creates a box the same size as an image's (unrotated) bitmap."""
+        w, h = image.pixels.get_size()
+        return cls(w * scale, h * scale)
+
+    def axes(self, angle=0.0):
+        """Gets the box's two (unit length) axes at a given rotation."""
+        c, s = _cossin(angle)
+        return ((c, -s), (s, c))
+
+    def vertices(self, x, y, angle=0.0):
+        """Gets the four corners of the placed box."""
+        cx, cy = self.center(x, y, angle)
+        (ux, uy), (vx, vy) = self.axes(angle)
+        hw, hh = self.halfwidth, self.halfheight
+        return ((cx - ux*hw - vx*hh, cy - uy*hw - vy*hh),
+                (cx + ux*hw - vx*hh, cy + uy*hw - vy*hh),
+                (cx + ux*hw + vx*hh, cy + uy*hw + vy*hh),
+                (cx - ux*hw + vx*hh, cy - uy*hw + vy*hh))
+
+    def bounds(self, x, y, angle=0.0):
+        return _vertexBounds(self.vertices(x, y, angle))
+
+class Polygon(Shape):
+    """A convex polygon.
+
+       @param points: A sequence of (x,y) vertices, relative to the center of
+           the sprite, in order around the polygon (either direction). The
+           polygon must be convex, or collisions will not be accurate.
+       @param offset: An extra offset added to every point.
+    """
+    kind = 3
+
+    def __init__(self, points, offset=(0,0)):
+        super(Polygon, self).__init__(offset)
+        if len(points) < 3:
+            raise ValueError, "A Polygon needs at least three points"
+        ox, oy = self.offset
+        self.points = tuple((p[0] + ox, p[1] + oy) for p in points)
+
+        # the edge normals of the unrotated polygon, used as SAT axes
+        normals = []
+        n = len(self.points)
+        for i in xrange(n):
+            (x1, y1), (x2, y2) = self.points[i], self.points[(i+1) % n]
+            ex, ey = x2 - x1, y2 - y1
+            l = math.hypot(ex, ey)
+            if l:
+                normals.append((-ey / l, ex / l))
+        self._normals = tuple(normals)
+
+    def center(self, x, y, angle=0.0):
+        # the offset has already been applied to the points
+        return x, y
+
+    def vertices(self, x, y, angle=0.0):
+        """Gets the corners of the placed polygon."""
+        if not angle:
+            return [(x + px, y + py) for px, py in self.points]
+        c, s = _cossin(angle)
+        return [(x + px*c + py*s, y - px*s + py*c) for px, py in self.points]
+
+    def axes(self, angle=0.0):
+        """Gets the edge normals of the polygon at a given rotation."""
+        if not angle:
+            return self._normals
+        c, s = _cossin(angle)
+        return [(nx*c + ny*s, -nx*s + ny*c) for nx, ny in self._normals]
+
+    def bounds(self, x, y, angle=0.0):
+        return _vertexBounds(self.vertices(x, y, angle))
+
+###
+# Pair tests
+# Each takes two shapes and their placements (x, y, angle), and the
+# table below maps a pair of shape kinds to the right function.
+###
+
+def _circleCircle(a, ax, ay, aa, b, bx, by, ba):
+    acx, acy = a.center(ax, ay, aa)
+    bcx, bcy = b.center(bx, by, ba)
+    dx, dy = bcx - acx, bcy - acy
+    r = a.radius + b.radius
+    return dx*dx + dy*dy <= r*r
+
+def _circleAABB(a, ax, ay, aa, b, bx, by, ba):
+    cx, cy = a.center(ax, ay, aa)
+    l, t, r, bt = b.extents(bx, by)
+    # closest point on the box to the circle's center
+    dx = cx - min(max(cx, l), r)
+    dy = cy - min(max(cy, t), bt)
+    return dx*dx + dy*dy <= a.radius * a.radius
+
+def _circleOBB(a, ax, ay, aa, b, bx, by, ba):
+    cx, cy = a.center(ax, ay, aa)
+    bcx, bcy = b.center(bx, by, ba)
+    (ux, uy), (vx, vy) = b.axes(ba)
+    # move the circle's center into the box's frame, then clamp
+    rx, ry = cx - bcx, cy - bcy
+    lx, ly = rx*ux + ry*uy, rx*vx + ry*vy
+    hw, hh = b.halfwidth, b.halfheight
+    dx = lx - min(max(lx, -hw), hw)
+    dy = ly - min(max(ly, -hh), hh)
+    return dx*dx + dy*dy <= a.radius * a.radius
+
+def _circlePolygon(a, ax, ay, aa, b, bx, by, ba):
+    cx, cy = a.center(ax, ay, aa)
+    r = a.radius
+    verts = b.vertices(bx, by, ba)
+    n = len(verts)
+    inside, side = True, 0
+    for i in xrange(n):
+        (x1, y1), (x2, y2) = verts[i], verts[(i+1) % n]
+        ex, ey = x2 - x1, y2 - y1
+        px, py = cx - x1, cy - y1
+        # distance from the center to this edge (as a segment)
+        ll = ex*ex + ey*ey
+        t = (px*ex + py*ey) / ll if ll else 0.0
+        t = min(max(t, 0.0), 1.0)
+        dx, dy = px - ex*t, py - ey*t
+        if dx*dx + dy*dy <= r*r:
+            return True
+        # the center is inside only if it's on the same side of every edge
+        cross = ex*py - ey*px
+        if cross:
+            s = 1 if cross > 0 else -1
+            if side and s != side:
+                inside = False
+            side = s
+    return inside
+
+def _aabbAABB(a, ax, ay, aa, b, bx, by, ba):
+    al, at, ar, ab = a.extents(ax, ay)
+    bl, bt, br, bb = b.extents(bx, by)
+    return al <= br and bl <= ar and at <= bb and bt <= ab
+
+def _project(verts, axis):
+    """Projects a list of vertices onto an axis, returning (min, max)."""
+    nx, ny = axis
+    lo = hi = verts[0][0]*nx + verts[0][1]*ny
+    for vx, vy in verts[1:]:
+        d = vx*nx + vy*ny
+        if d < lo:
+            lo = d
+        elif d > hi:
+            hi = d
+    return lo, hi
+
+def _sat(averts, aaxes, bverts, baxes):
+    """Separating axis test for two convex vertex lists."""
+    for axes in (aaxes, baxes):
+        for axis in axes:
+            amin, amax = _project(averts, axis)
+            bmin, bmax = _project(bverts, axis)
+            if amax < bmin or bmax < amin:
+                return False
+    return True
+
+# the axes of an AABB never change
+_AABB_AXES = ((1.0, 0.0), (0.0, 1.0))
+
+def _axesOf(s, angle):
+    if s.kind == AABB.kind:
+        return _AABB_AXES
+    return s.axes(angle)
+
+def _convexConvex(a, ax, ay, aa, b, bx, by, ba):
+    return _sat(a.vertices(ax, ay, aa), _axesOf(a, aa),
+                b.vertices(bx, by, ba), _axesOf(b, ba))
+
+_tests = {
+    (Circle.kind, Circle.kind): _circleCircle,
+    (Circle.kind, AABB.kind): _circleAABB,
+    (Circle.kind, OrientedBox.kind): _circleOBB,
+    (Circle.kind, Polygon.kind): _circlePolygon,
+    (AABB.kind, AABB.kind): _aabbAABB,
+    (AABB.kind, OrientedBox.kind): _convexConvex,
+    (AABB.kind, Polygon.kind): _convexConvex,
+    (OrientedBox.kind, OrientedBox.kind): _convexConvex,
+    (OrientedBox.kind, Polygon.kind): _convexConvex,
+    (Polygon.kind, Polygon.kind): _convexConvex,
+}
+
+def overlap(a, apos, b, bpos):
+    """Tests whether two placed shapes overlap.
+
+       @param a: The first L{Shape}.
+       @param apos: The placement of the first shape, as (x, y, angle).
+       @param b: The second Shape.
+       @param bpos: The placement of the second shape, as (x, y, angle).
+       @return: Whether the two shapes overlap (touching counts).
+    """
+    test = _tests.get((a.kind, b.kind))
+    if test is not None:
+        return test(a, apos[0], apos[1], apos[2], b, bpos[0], bpos[1], bpos[2])
+    return _tests[(b.kind, a.kind)](b, bpos[0], bpos[1], bpos[2],
+                                    a, apos[0], apos[1], apos[2])
+
+###
+# Ray tests
+# Each takes a shape, its placement, and a ray (origin and unit direction),
+# and returns the distance along the ray where it first enters the shape,
+# 0 if the origin is inside, or None for a miss.
+###
+
+def _slab(o, d, lo, hi, tmin, tmax):
+    """Clips a ray's range of distances against one axis of a box."""
+    if d == 0:
+        if o < lo or o > hi:
+            return None
+        return tmin, tmax
+    t1, t2 = (lo - o) / d, (hi - o) / d
+    if t1 > t2:
+        t1, t2 = t2, t1
+    tmin, tmax = max(tmin, t1), min(tmax, t2)
+    if tmin > tmax:
+        return None
+    return tmin, tmax
+
+def clipRay(ox, oy, dx, dy, left, top, right, bottom, maxDistance=None):
+    """Clips a ray to an axis-aligned box given by its edges.
+
+       @return: A tuple (enter, exit) of the distances along the ray where
+           it is inside the box, or None if it misses.
+    """
+    if maxDistance is None:
+        maxDistance = float('inf')
+    span = _slab(ox, dx, left, right, 0.0, maxDistance)
+    if span is not None:
+        span = _slab(oy, dy, top, bottom, span[0], span[1])
+    return span
+
+def rayBox(ox, oy, dx, dy, left, top, right, bottom):
+    """Intersects a ray with an axis-aligned box given by its edges.
+
+       @return: The distance along the ray to the box, or None.
+    """
+    span = clipRay(ox, oy, dx, dy, left, top, right, bottom)
+    return span[0] if span is not None else None
+
+def _rayCircle(s, x, y, angle, ox, oy, dx, dy):
+    cx, cy = s.center(x, y, angle)
+    fx, fy = ox - cx, oy - cy
+    c = fx*fx + fy*fy - s.radius * s.radius
+    if c <= 0:
+        # starting inside the circle
+        return 0.0
+    b = fx*dx + fy*dy
+    disc = b*b - c
+    if b > 0 or disc < 0:
+        return None
+    return -b - math.sqrt(disc)
+
+def _rayAABB(s, x, y, angle, ox, oy, dx, dy):
+    return rayBox(ox, oy, dx, dy, *s.extents(x, y))
+
+def _rayOBB(s, x, y, angle, ox, oy, dx, dy):
+    cx, cy = s.center(x, y, angle)
+    (ux, uy), (vx, vy) = s.axes(angle)
+    # do the test in the box's own frame
+    rx, ry = ox - cx, oy - cy
+    lox, loy = rx*ux + ry*uy, rx*vx + ry*vy
+    ldx, ldy = dx*ux + dy*uy, dx*vx + dy*vy
+    hw, hh = s.halfwidth, s.halfheight
+    return rayBox(lox, loy, ldx, ldy, -hw, -hh, hw, hh)
+
+def _rayPolygon(s, x, y, angle, ox, oy, dx, dy):
+    # Cyrus-Beck clipping against each edge
+    verts = s.vertices(x, y, angle)
+    n = len(verts)
+    mx = sum(v[0] for v in verts) / n
+    my = sum(v[1] for v in verts) / n
+    tenter, texit = 0.0, float('inf')
+    for i in xrange(n):
+        (x1, y1), (x2, y2) = verts[i], verts[(i+1) % n]
+        nx, ny = y2 - y1, x1 - x2
+        if nx*(x1 - mx) + ny*(y1 - my) < 0:
+            # make the normal point outward
+            nx, ny = -nx, -ny
+        denom = nx*dx + ny*dy
+        num = nx*(x1 - ox) + ny*(y1 - oy)
+        if denom == 0:
+            if num < 0:
+                return None
+        elif denom < 0:
+            tenter = max(tenter, num / denom)
+        else:
+            texit = min(texit, num / denom)
+        if tenter > texit:
+            return None
+    return tenter
+
+_rayTests = {
+    Circle.kind: _rayCircle,
+    AABB.kind: _rayAABB,
+    OrientedBox.kind: _rayOBB,
+    Polygon.kind: _rayPolygon,
+}
+
+def intersectRay(s, pos, origin, direction):
+    """Finds where a ray first hits a placed shape.
+
+       @param s: The L{Shape}.
+       @param pos: The placement of the shape, as (x, y, angle).
+       @param origin: The start of the ray.
+       @param direction: The direction of the ray, as a unit vector.
+       @return: The distance along the ray where it enters the shape (0 if
+           it starts inside), or None if the ray misses.
+    """
+    return _rayTests[s.kind](s, pos[0], pos[1], pos[2],
+                             origin[0], origin[1], direction[0], direction[1])
+
+def fromRect(rect):
+    """Makes an AABB and its placement from a pygame Rect.
+
+       @return: A tuple (shape, placement) that can be passed to L{overlap}.
+    """
+    return AABB(rect.width, rect.height), \
+           (rect.x + rect.width/2., rect.y + rect.height/2., 0.0)
+
+###
+# Helpers
+###
+
+def _cossin(angle):
+    r = math.radians(angle)
+    return math.cos(r), math.sin(r)
+
+def _vertexBounds(verts):
+    xs = [v[0] for v in verts]
+    ys = [v[1] for v in verts]
+    l, t = int(math.floor(min(xs))), int(math.floor(min(ys)))
+    return Rect(l, t, int(math.ceil(max(xs))) - l + 1,
+                int(math.ceil(max(ys))) - t + 1)
@@ -0,0 +1,447 @@
+import shape
+
+__doc__ = """A dynamic spatial index for sprites
+
+The L{spatial} module contains the L{SpatialHash} class, a uniform grid that
+keeps track of where sprites are in the game world. Unlike the static
+L{QuadTree}, a SpatialHash stays current as its sprites move, so it can be
+used to answer "what's near here?" questions every frame without looping over
+every sprite in the game. The display list of every L{GameLoop} keeps one of
+these, and the GameLoop's C{getNearest}, C{getWithinRadius}, and C{getInRect}
+methods use it, as do its ray casting methods.
+
+All coordinates are world coordinates (unaffected by camera scrolling). A
+sprite's position in the index is the center of the sprite, and its extent
+is the size of its C{rect}."""
+
+__all__ = ['SpatialHash', 'spriteBounds']
+
+def spriteBounds(sprite):
+    """Gets the world-space position and extent of a sprite, by calling its
+       C{_worldBounds} method.
+
+       @return: A tuple (x, y, left, top, right, bottom), where (x,y) is the
+           center of the sprite.
+    """
+    return sprite._worldBounds()
+
+class SpatialHash(object):
+    """A uniform grid of sprites, used for fast spatial queries.
+
+       Sprites are stored in every grid cell that their extent covers. When
+       a sprite moves, it should call L{touch}; the index only works out the
+       sprite's new cells the next time a query is made, so a sprite that
+       moves several times in a frame costs no more than one that moves once.
+
+       Sprites that cover a very large number of cells (like a full-screen
+       background) are kept in a separate list and checked by every query
+       instead.
+
+       @param cellsize: The width and height of a grid cell, in pixels.
+           This should be a bit larger than a typical sprite.
+       @param boundsfunc: A function that gets the extent of a sprite, in the
+           same form as L{spriteBounds} (the default).
+    """
+
+    # sprites covering more cells than this are "oversized"
+    MAX_CELLS = 256
+
+    def __init__(self, cellsize=64, boundsfunc=spriteBounds):
+        self.cellsize = cellsize
+        self._boundsfunc = boundsfunc
+
+        # (column,row) -> set of sprites
+        self._cells = {}
+
+        # sprite -> (col0, row0, col1, row1, x, y, left, top, right, bottom)
+        # (col/row values are None for oversized sprites)
+        self._records = {}
+
+        # sprites too big to put in the grid
+        self._oversized = set()
+
+        # sprites that have moved since the last query
+        self._stale = set()
+
+        # the range of cells that have ever been used,
+        # as [mincol, minrow, maxcol, maxrow]
+        self._extent = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, sprite):
+        return sprite in self._records
+
+    def insert(self, sprite):
+        """Adds a sprite to the index."""
+        if sprite in self._records:
+            self._stale.add(sprite)
+        else:
+            self._place(sprite)
+
+    def remove(self, sprite):
+        """Removes a sprite from the index. Removing a sprite that isn't in
+           the index is harmless."""
+        record = self._records.pop(sprite, None)
+        if record is None:
+            return
+        self._stale.discard(sprite)
+        self._unplace(sprite, record)
+
+    def touch(self, sprite):
+        """Marks a sprite as having moved (or changed size)."""
+        self._stale.add(sprite)
+
+    def clear(self):
+        """Removes all the sprites from the index."""
+        self._cells.clear()
+        self._records.clear()
+        self._oversized.clear()
+        self._stale.clear()
+        self._extent = None
+
+    ###
+    # Queries
+    ###
+
+    def inRect(self, rect, accept=None):
+        """Gets the sprites whose extents intersect a rectangle.
+
+           @param rect: A Rect (or sequence of x, y, width, height) in world
+               coordinates.
+           @param accept: An optional function that takes a sprite and
+               returns whether it should be included.
+           @return: A list of sprites, in no particular order.
+        """
+        self._refresh()
+        left, top = rect[0], rect[1]
+        right, bottom = left + rect[2], top + rect[3]
+
+        hits = []
+        records = self._records
+        for sprite in self._candidates(left, top, right, bottom):
+            r = records[sprite]
+            if r[6] <= right and left <= r[8] and r[7] <= bottom and top <= r[9]:
+                if accept is None or accept(sprite):
+                    hits.append(sprite)
+        return hits
+
+    def withinRadius(self, pos, radius, accept=None):
+        """Gets the sprites whose centers are within a given distance of
+           a point.
+
+           @param pos: The (x,y) position in world coordinates.
+           @param radius: The distance from C{pos}.
+           @param accept: An optional function that takes a sprite and
+               returns whether it should be included.
+           @return: A list of sprites, in no particular order.
+        """
+        self._refresh()
+        px, py = pos[0], pos[1]
+        r2 = radius * radius
+
+        hits = []
+        records = self._records
+        for sprite in self._candidates(px - radius, py - radius,
+                                       px + radius, py + radius):
+            r = records[sprite]
+            dx, dy = r[4] - px, r[5] - py
+            if dx*dx + dy*dy <= r2:
+                if accept is None or accept(sprite):
+                    hits.append(sprite)
+        return hits
+
+    def touchingRadius(self, pos, radius, accept=None):
+        """Gets the sprites whose extents come within a given distance of a
+           point. Unlike L{withinRadius}, this finds a large sprite when any
+           part of it is close, even if its center is far away.
+
+           @param pos: The (x,y) position in world coordinates.
+           @param radius: The distance from C{pos}.
+           @param accept: An optional function that takes a sprite and
+               returns whether it should be included.
+           @return: A list of sprites, in no particular order.
+        """
+        self._refresh()
+        px, py = pos[0], pos[1]
+        r2 = radius * radius
+
+        hits = []
+        records = self._records
+        for sprite in self._candidates(px - radius, py - radius,
+                                       px + radius, py + radius):
+            r = records[sprite]
+            # the distance to the closest point of the extent
+            dx = max(r[6] - px, 0, px - r[8])
+            dy = max(r[7] - py, 0, py - r[9])
+            if dx*dx + dy*dy <= r2:
+                if accept is None or accept(sprite):
+                    hits.append(sprite)
+        return hits
+
+    def nearest(self, pos, count=1, accept=None, maxDistance=None):
+        """Gets the sprites whose centers are closest to a point.
+
+           The search works outward from the point one ring of grid cells at
+           a time, and stops as soon as no unsearched cell could hold a
+           closer sprite.
+
+           @param pos: The (x,y) position in world coordinates.
+           @param count: The maximum number of sprites to return.
+           @param accept: An optional function that takes a sprite and
+               returns whether it should be included.
+           @param maxDistance: If given, sprites farther away than this
+               are never returned.
+           @return: A list of up to C{count} sprites, closest first.
+        """
+        self._refresh()
+        if count < 1 or not self._records:
+            return []
+
+        px, py = pos[0], pos[1]
+        cs = self.cellsize
+        col, row = int(px // cs), int(py // cs)
+        maxd2 = maxDistance * maxDistance if maxDistance is not None else None
+
+        records = self._records
+        cells = self._cells
+        seen = set()
+        found = []      # (distance squared, sprite)
+
+        def consider(sprite):
+            seen.add(sprite)
+            r = records[sprite]
+            dx, dy = r[4] - px, r[5] - py
+            d2 = dx*dx + dy*dy
+            if (maxd2 is None or d2 <= maxd2) and (accept is None or accept(sprite)):
+                found.append((d2, sprite))
+
+        for sprite in self._oversized:
+            consider(sprite)
+
+        if self._extent is not None:
+            mincol, minrow, maxcol, maxrow = self._extent
+            # the farthest ring that can contain anything
+            lastring = max(col - mincol, maxcol - col, row - minrow, maxrow - row)
+            # the nearest ring that can contain anything
+            ring = max(0, mincol - col, col - maxcol, minrow - row, row - maxrow)
+
+            while ring <= lastring:
+                for cell in _ring(col, row, ring):
+                    contents = cells.get(cell)
+                    if contents:
+                        for sprite in contents:
+                            if sprite not in seen:
+                                consider(sprite)
+
+                # everything outside this ring is at least this far away
+                reach = ring * cs
+                if maxDistance is not None and reach > maxDistance:
+                    break
+                if len(found) >= count:
+                    found.sort()
+                    del found[count:]
+                    if found[-1][0] <= reach * reach:
+                        break
+                ring += 1
+
+        found.sort()
+        return [sprite for d2, sprite in found[:count]]
+
+    def castRay(self, origin, direction, test, maxDistance=None, first=True):
+        """Finds the sprites hit by a ray, in order of distance.
+
+           The ray is walked through the grid one cell at a time, and each
+           sprite in those cells is given to the C{test} function. When only
+           the first hit is wanted, the walk stops as soon as no later cell
+           could hold a closer hit.
+
+           @param origin: The start of the ray, in world coordinates.
+           @param direction: The direction of the ray, as a unit vector.
+           @param test: A function C{test(sprite, origin, direction,
+               maxDistance, first)} that returns a list of hits on that
+               sprite. Each hit must have a C{distance} attribute.
+           @param maxDistance: The length of the ray, or None for no limit.
+           @param first: If True, only the closest hit is returned.
+           @return: A list of hits, closest first.
+        """
+        self._refresh()
+        ox, oy = origin[0], origin[1]
+        dx, dy = direction[0], direction[1]
+        inf = float('inf')
+        limit = [maxDistance if maxDistance is not None else inf]
+        hits = []
+        seen = set()
+
+        def check(sprite):
+            seen.add(sprite)
+            for hit in test(sprite, origin, direction, limit[0], first):
+                if hit.distance <= limit[0]:
+                    hits.append(hit)
+                    if first:
+                        limit[0] = hit.distance
+
+        for sprite in self._oversized:
+            check(sprite)
+
+        extent = self._extent
+        if extent is not None:
+            cs = self.cellsize
+            span = shape.clipRay(ox, oy, dx, dy,
+                                 extent[0] * cs, extent[1] * cs,
+                                 (extent[2] + 1) * cs, (extent[3] + 1) * cs,
+                                 limit[0])
+            if span is not None:
+                cells = self._cells
+                t, tend = span
+                col = min(max(int((ox + dx*t) // cs), extent[0]), extent[2])
+                row = min(max(int((oy + dy*t) // cs), extent[1]), extent[3])
+                stepc, tnextc, tdeltac = _ddaAxis(ox, dx, col, cs)
+                stepr, tnextr, tdeltar = _ddaAxis(oy, dy, row, cs)
+
+                while True:
+                    contents = cells.get((col, row))
+                    if contents:
+                        for sprite in list(contents):
+                            if sprite not in seen:
+                                check(sprite)
+
+                    texit = min(tnextc, tnextr)
+                    if texit > min(tend, limit[0]) or (first and hits and limit[0] <= texit):
+                        break
+                    if tnextc < tnextr:
+                        col += stepc
+                        tnextc += tdeltac
+                    else:
+                        row += stepr
+                        tnextr += tdeltar
+
+        hits.sort(key=lambda h: h.distance)
+        return hits[:1] if first else hits
+
+    ###
+    # Helpers
+    ###
+
+    def _refresh(self):
+        """Moves all the stale sprites to their new cells."""
+        if self._stale:
+            stale = self._stale
+            self._stale = set()
+            records = self._records
+            boundsfunc = self._boundsfunc
+            cs = self.cellsize
+            for sprite in stale:
+                record = records.get(sprite)
+                if record is None:
+                    continue
+                bounds = boundsfunc(sprite)
+                if record[0] is not None and \
+                   record[0] == int(bounds[2] // cs) and \
+                   record[1] == int(bounds[3] // cs) and \
+                   record[2] == int(bounds[4] // cs) and \
+                   record[3] == int(bounds[5] // cs):
+                    # still in the same cells, so only the record changes
+                    records[sprite] = record[:4] + bounds
+                else:
+                    del records[sprite]
+                    self._unplace(sprite, record)
+                    self._place(sprite, bounds)
+
+    def _place(self, sprite, bounds=None):
+        if bounds is None:
+            bounds = self._boundsfunc(sprite)
+        x, y, left, top, right, bottom = bounds
+        cs = self.cellsize
+        c0, r0 = int(left // cs), int(top // cs)
+        c1, r1 = int(right // cs), int(bottom // cs)
+
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > self.MAX_CELLS:
+            self._oversized.add(sprite)
+            self._records[sprite] = (None, None, None, None,
+                                     x, y, left, top, right, bottom)
+            return
+
+        cells = self._cells
+        for c in xrange(c0, c1 + 1):
+            for r in xrange(r0, r1 + 1):
+                contents = cells.get((c, r))
+                if contents is None:
+                    cells[(c, r)] = set([sprite])
+                else:
+                    contents.add(sprite)
+        self._records[sprite] = (c0, r0, c1, r1, x, y, left, top, right, bottom)
+
+        extent = self._extent
+        if extent is None:
+            self._extent = [c0, r0, c1, r1]
+        else:
+            if c0 < extent[0]: extent[0] = c0
+            if r0 < extent[1]: extent[1] = r0
+            if c1 > extent[2]: extent[2] = c1
+            if r1 > extent[3]: extent[3] = r1
+
+    def _unplace(self, sprite, record):
+        c0, r0, c1, r1 = record[:4]
+        if c0 is None:
+            self._oversized.discard(sprite)
+            return
+
+        cells = self._cells
+        for c in xrange(c0, c1 + 1):
+            for r in xrange(r0, r1 + 1):
+                contents = cells.get((c, r))
+                if contents is not None:
+                    contents.discard(sprite)
+                    if not contents:
+                        del cells[(c, r)]
+
+    def _candidates(self, left, top, right, bottom):
+        """Gets the set of sprites in the cells covering an area."""
+        cs = self.cellsize
+        c0, r0 = int(left // cs), int(top // cs)
+        c1, r1 = int(right // cs), int(bottom // cs)
+
+        extent = self._extent
+        if extent is not None:
+            # don't bother looking at cells that have never been used
+            c0, r0 = max(c0, extent[0]), max(r0, extent[1])
+            c1, r1 = min(c1, extent[2]), min(r1, extent[3])
+
+        found = set(self._oversized)
+        cells = self._cells
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > len(cells):
+            # the area is bigger than the occupied part of the grid
+            for (c, r), contents in cells.iteritems():
+                if c0 <= c <= c1 and r0 <= r <= r1:
+                    found.update(contents)
+        else:
+            for c in xrange(c0, c1 + 1):
+                for r in xrange(r0, r1 + 1):
+                    contents = cells.get((c, r))
+                    if contents:
+                        found.update(contents)
+        return found
+
+def _ddaAxis(o, d, cell, size):
+    """Sets up one axis of a grid walk: (step, next boundary, boundary spacing)."""
+    if d > 0:
+        return 1, ((cell + 1) * size - o) / d, size / d
+    elif d < 0:
+        return -1, (cell * size - o) / d, size / -d
+    else:
+        return 0, float('inf'), float('inf')
+
+def _ring(col, row, ring):
+    """Generates the cells in a square ring around a cell."""
+    if ring == 0:
+        yield (col, row)
+        return
+    top, bottom = row - ring, row + ring
+    for c in xrange(col - ring, col + ring + 1):
+        yield (c, top)
+        yield (c, bottom)
+    for r in xrange(top + 1, bottom):
+        yield (col - ring, r)
+        yield (col + ring, r)
@@ -32,7 +32,7 @@ class SpriteSheet(object):
     def __init__(self, surface, **kwargs):
         if isinstance(surface, basestring):
             # if we got a filename
-            self.sheet = Game.Image.load(surface)
+            self.sheet = Game.loadImage(surface)
         else:
             # if it's not a filename, then it's a surface
             # TODO: error if it's neither
@@ -0,0 +1,326 @@
+import os, threading, Queue
+import cPickle as pickle
+from gameloop import Game
+from tilemap import TileMap
+
+__doc__ = """Streaming a large world from disk
+
+The L{streaming} module contains the L{ChunkManager}, which lets a game world
+be much larger than what is kept in memory. The world is divided into square
+chunks, each stored in its own file, holding the chunk's tile map (if it has
+one) and a list of the entities that should be spawned in it. Chunks near the
+camera are read on a worker thread and built into sprites as they arrive;
+chunks that are left far behind have their entities saved back to disk and are
+removed from the world. However big the map is, the memory used and the number
+of live entities depend only on how many chunks are kept loaded.
+
+Entities are saved as "spawn records": a kind (a name registered with the
+manager, along with a function that creates that kind of entity) and a state
+dictionary. By default, the state holds only an entity's position, but an
+entity with a C{saveState} method can return anything that can be pickled. The
+manager only streams the entities that it spawned itself, so a player (or
+anything else added to the world directly) is never saved or removed.
+
+Chunk files can be written ahead of time (by a level editor, say) with
+L{ChunkManager.writeChunk}."""
+
+__all__ = ['ChunkManager']
+
+class ChunkManager(object):
+    """Loads and saves the chunks of a world around the camera.
+
+       A L{World} with a C{streamer} calls its L{update} method every frame.
+
+       @param directory: The directory holding the chunk files.
+       @keyword chunkSize: The width and height of a chunk, in pixels. (This
+           should be a multiple of the tile size, if there are tile maps.)
+       @keyword radius: How many chunks around the one at the center of the
+           screen are kept loaded. Chunks are unloaded once they are more than
+           C{radius+1} chunks away, so that moving back and forth over a chunk
+           border doesn't load and unload the same chunks over and over.
+       @keyword sheet: The L{SpriteSheet} used for the chunks' tile maps.
+       @keyword buildsPerFrame: The most chunks that are built into sprites in
+           a single frame, so that arriving chunks don't cause a hitch.
+
+       @ivar tilemaps: A dictionary of the tile maps of the loaded chunks,
+           keyed by chunk coordinates (column, row).
+       @ivar unsaved: A list of the chunk data that couldn't be written, as
+           (key, tiles, spawns) tuples, so that it isn't lost. (The error is
+           raised by the next call to L{update} or L{flush}.)
+    """
+    def __init__(self, directory, **kwargs):
+        self.directory = directory
+        self.chunkSize = kwargs.get('chunkSize', 1024)
+        self.radius = kwargs.get('radius', 1)
+        self.sheet = kwargs.get('sheet', None)
+        self.buildsPerFrame = kwargs.get('buildsPerFrame', 1)
+
+        self.tilemaps = {}
+        self.unsaved = []
+
+        # kind -> function that creates an entity from its state
+        self._factories = {}
+
+        # streamed entity -> its kind
+        self._spawned = {}
+
+        # chunks that are built, and those that have been asked for (each
+        # request is numbered, so a stale read is never built)
+        self._loaded = set()
+        self._pending = {}
+        self._nextRequest = 0
+
+        # requests for the worker, and the chunks it has read
+        self._requests = Queue.Queue()
+        self._arrived = Queue.Queue()
+        self._worker = None
+
+    def register(self, kind, factory):
+        """Registers a kind of entity that can be stored in chunks.
+
+           @param kind: The name used for this kind in spawn records.
+           @param factory: A function that takes a state dictionary and returns
+               a new entity.
+        """
+        self._factories[kind] = factory
+
+    def spawn(self, kind, state):
+        """Creates an entity of a registered kind and adds it to the world.
+           The entity is streamed: it is saved with whatever chunk it is in
+           when that chunk is unloaded.
+
+           @param kind: The name of a registered kind.
+           @param state: The state dictionary passed to the kind's factory.
+           @return: The new entity.
+        """
+        sprite = self._factories[kind](state)
+        self._spawned[sprite] = kind
+        Game.world.add(sprite)
+        return sprite
+
+    def chunkAt(self, x, y):
+        """Gets the coordinates (column, row) of the chunk holding a point."""
+        size = self.chunkSize
+        return (int(x // size), int(y // size))
+
+    @property
+    def loadedChunks(self):
+        """The coordinates of the chunks that are currently loaded."""
+        return frozenset(self._loaded)
+
+    @property
+    def liveEntities(self):
+        """The number of streamed entities in the world."""
+        return len(self._spawned)
+
+    def update(self, center):
+        """Loads the chunks near a point, builds those that have arrived,
+           and unloads those that are too far away.
+
+           @param center: The point (usually the center of the screen) that
+               chunks are loaded around, in world coordinates, or a list of
+               points (for a split screen).
+        """
+        centers = center if isinstance(center, list) else (center,)
+        centers = [self.chunkAt(c[0], c[1]) for c in centers]
+        radius = self.radius
+
+        # ask for the chunks that are near
+        for ccol, crow in centers:
+            for row in xrange(crow - radius, crow + radius + 1):
+                for col in xrange(ccol - radius, ccol + radius + 1):
+                    key = (col, row)
+                    if key not in self._loaded and key not in self._pending:
+                        self._nextRequest += 1
+                        self._pending[key] = self._nextRequest
+                        self._request(('load', key, self._nextRequest))
+
+        # build the ones that have been read
+        for i in xrange(self.buildsPerFrame):
+            try:
+                key, number, data = self._arrived.get_nowait()
+            except Queue.Empty:
+                break
+            if number is None:
+                # a write that failed
+                raise data
+            if self._pending.get(key) == number:
+                del self._pending[key]
+                if isinstance(data, Exception):
+                    raise data
+                self._build(key, data)
+
+        # forget the ones that are far away
+        keep = radius + 1
+        far = lambda key: all(abs(key[0] - ccol) > keep or abs(key[1] - crow) > keep
+                              for ccol, crow in centers)
+        for key in list(self._loaded):
+            if far(key):
+                self.unload(key)
+        for key in list(self._pending):
+            if far(key):
+                # it will be thrown away when it arrives
+                del self._pending[key]
+
+        self._strays()
+
+    def unload(self, key):
+        """Saves a loaded chunk (its tile map and the streamed entities in it)
+           back to disk and removes it from the world.
+
+           @param key: The chunk's coordinates (column, row).
+        """
+        self._loaded.discard(key)
+        tilemap = self.tilemaps.pop(key, None)
+        tiles = None
+        if tilemap is not None:
+            tiles = tilemap.themap
+            tilemap.kill()
+
+        spawns = [self._store(s) for s in self._entitiesIn(key)]
+        self._request(('save', key, {'tiles': tiles, 'spawns': spawns}))
+
+    def flush(self):
+        """Unloads every chunk, and waits until they have all been written."""
+        for key in list(self._loaded):
+            self.unload(key)
+        self._pending.clear()
+        self._strays()
+        if self._worker is not None:
+            self._requests.join()
+
+        # anything read since is thrown away, but failed writes are reported
+        while True:
+            try:
+                key, number, data = self._arrived.get_nowait()
+            except Queue.Empty:
+                break
+            if number is None:
+                raise data
+
+    @staticmethod
+    def writeChunk(directory, key, tiles=None, spawns=()):
+        """Writes a chunk file.
+
+           @param directory: The directory holding the chunk files.
+           @param key: The chunk's coordinates (column, row).
+           @param tiles: The chunk's tile map (a list of rows of tile
+               indices, as for L{TileMap}), or None.
+           @param spawns: A list of spawn records, each a tuple (kind,
+               state), where the state is a dictionary.
+        """
+        data = {'tiles': tiles, 'spawns': list(spawns)}
+        path = ChunkManager._path(directory, key)
+        f = open(path + '.tmp', 'wb')
+        try:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        except:
+            f.close()
+            os.remove(path + '.tmp')
+            raise
+        f.close()
+        # replace the old file only once the new one is complete
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path + '.tmp', path)
+
+    @staticmethod
+    def readChunk(directory, key):
+        """Reads a chunk file. A chunk with no file is empty.
+
+           @return: A dictionary with C{tiles} and C{spawns} entries, as
+               given to L{writeChunk}.
+        """
+        path = ChunkManager._path(directory, key)
+        if not os.path.exists(path):
+            return {'tiles': None, 'spawns': []}
+        f = open(path, 'rb')
+        try:
+            return pickle.load(f)
+        finally:
+            f.close()
+
+    @staticmethod
+    def _path(directory, key):
+        return os.path.join(directory, 'chunk_%d_%d.dat' % key)
+
+    def _build(self, key, data):
+        """Makes the sprites for a chunk that has been read."""
+        self._loaded.add(key)
+        size = self.chunkSize
+        if data['tiles'] is not None:
+            tilemap = TileMap(self.sheet, data['tiles'],
+                              x=key[0]*size, y=key[1]*size)
+            self.tilemaps[key] = tilemap
+            Game.world.add(tilemap)
+        for kind, state in data['spawns']:
+            self.spawn(kind, state)
+
+    def _store(self, sprite):
+        """Removes a streamed entity from the world, returning its spawn
+           record."""
+        kind = self._spawned.pop(sprite)
+        save = getattr(sprite, 'saveState', None)
+        state = save() if save is not None else {'x': sprite.x, 'y': sprite.y}
+        sprite.kill()
+        return (kind, state)
+
+    def _entitiesIn(self, key):
+        """Gets the streamed entities whose positions are in a chunk."""
+        chunkAt = self.chunkAt
+        return [s for s in self._spawned if chunkAt(s.x, s.y) == key]
+
+    def _strays(self):
+        """Saves the streamed entities that have died, or wandered off into
+           chunks that aren't loaded."""
+        strays = {}
+        for sprite in self._spawned.keys():
+            if not sprite.alive:
+                # killed by the game, so it's gone for good
+                del self._spawned[sprite]
+                continue
+            key = self.chunkAt(sprite.x, sprite.y)
+            if key not in self._loaded and key not in self._pending:
+                strays.setdefault(key, []).append(self._store(sprite))
+        for key, spawns in strays.iteritems():
+            self._request(('append', key, spawns))
+
+    def _request(self, request):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._work)
+            self._worker.daemon = True
+            self._worker.start()
+        self._requests.put(request)
+
+    def _work(self):
+        """The worker thread, which handles requests in order, so a chunk is
+           always read after any earlier writes to it."""
+        directory = self.directory
+        while True:
+            request = self._requests.get()
+            op, key = request[0], request[1]
+            try:
+                if op == 'load':
+                    try:
+                        data = self.readChunk(directory, key)
+                    except Exception, e:
+                        # passed on to the main thread by update
+                        data = e
+                    self._arrived.put((key, request[2], data))
+                elif op == 'save':
+                    self.writeChunk(directory, key, **request[2])
+                elif op == 'append':
+                    data = self.readChunk(directory, key)
+                    self.writeChunk(directory, key, data['tiles'],
+                                    data['spawns'] + request[2])
+            except Exception, e:
+                # the entities have already left the world, so they're kept
+                # here, and the error is passed on to the main thread
+                if op == 'save':
+                    self.unsaved.append((key, request[2]['tiles'],
+                                         request[2]['spawns']))
+                else:
+                    self.unsaved.append((key, None, request[2]))
+                self._arrived.put((key, None, e))
+            finally:
+                self._requests.task_done()
@@ -6,7 +6,10 @@ __doc__ = """A tiled image, as used for backgrounds and terrain
 The L{tiledimage} module's single class, L{TiledImage}, is a
 specialized subclass of L{Image} that repetitively blits a small bitmap across
 its surface, creating a textured or "tiled" appearance. This is often used in
-2D games to make blocky terrain or backgrounds."""
+2D games to make blocky terrain or backgrounds.
+
+A very large tiled image (a floor for a long scrolling level, say) can be
+made "virtual", so that it never holds a bitmap of its full size."""
 
 __all__ = ['TiledImage']
 
@@ -22,11 +25,36 @@ class TiledImage(entity.Image):
            constructor arguments. However, the position of a TiledImage is
            that of its top-left corner, not its center.
 
+       A virtual TiledImage only keeps its tile. When it is drawn, it shows
+       just the part of itself that is on the screen, taken from a buffer
+       tiled to the size of that part (plus one tile each way, so that the
+       buffer can be reused as the camera moves). Its memory use depends on
+       the size of the screen, not on how large the tiled area is. A virtual
+       image can't be rotated, and its C{pixels} are just the tile.
+
        @param img: An object with the bitmap to be used as the "tile". This
            can be a Pyrge L{Image}, a Pygame Surface, or a string containing
            a filename.
+       @keyword virtual: Whether to draw the tiles as they are shown, instead
+           of making a bitmap of the whole image. (The default is False.)
+
+       @ivar virtual: Whether this is a virtual image.
     """
     def __init__(self, img, *args, **kwargs):
+        self.virtual = kwargs.pop('virtual', False)
+
+        if self.virtual:
+            # the base class would make a surface of the full size, so it
+            # doesn't get told the size
+            if len(args) == 4:
+                args, size = args[:2], args[2:]
+            else:
+                w = kwargs.pop('width', 0.0)
+                w = kwargs.pop('w', w)
+                h = kwargs.pop('height', 0.0)
+                h = kwargs.pop('h', h)
+                size = kwargs.pop('size', (w, h))
+
         super(TiledImage, self).__init__(*args, **kwargs)
 
         if isinstance(img, Game.Surface):
@@ -42,6 +70,17 @@ class TiledImage(entity.Image):
             # don't know what to do
             raise TypeError, "Unable to find tile image"
 
+        if self.virtual:
+            self.pixels = self._tileimage
+            self.width, self.height = size
+
+            # the tiled buffer, and the part of it being shown
+            self._buffer = None
+            self._view = None
+
+            # the display list draws only the part on the screen
+            self._windowed = True
+
         # in case we didn't get passed a width or height
         if self.width == 0.0:
             self.width = self._tileimage.get_width()
@@ -52,7 +91,45 @@ class TiledImage(entity.Image):
         self.x += self.width/2
         self.y += self.height/2
 
-        self._doTile()
+        if not self.virtual:
+            self._doTile()
+
+    @property
+    def image(self):
+        """The currently displayed image. For a virtual image, this is only
+           the part last shown on the screen."""
+        if not self.virtual:
+            return super(TiledImage, self).image
+        if self._view is None:
+            # not drawn yet, so show (no more than) the first tile
+            tile = self._tileimage
+            self._showArea(Game.Rect(0, 0, min(self.width, tile.get_width()),
+                                     min(self.height, tile.get_height())))
+        return self._view
+
+    def _showArea(self, area):
+        """Sets up a virtual image to show part of itself.
+
+           @param area: A Rect, relative to the image's top-left corner.
+        """
+        tile = self._tileimage
+        imgwidth, imgheight = tile.get_size()
+        width = imgwidth * (-(-area.width // imgwidth) + 1)
+        height = imgheight * (-(-area.height // imgheight) + 1)
+
+        buf = self._buffer
+        if buf is None or buf.get_width() < width or buf.get_height() < height:
+            if buf is not None:
+                # grow to fit, but never shrink
+                width = max(width, buf.get_width())
+                height = max(height, buf.get_height())
+            buf = self._buffer = Game.Surface((width, height), tile.get_flags(), tile)
+            for xtile in xrange(0, width, imgwidth):
+                for ytile in xrange(0, height, imgheight):
+                    buf.blit(tile, (xtile,ytile))
+
+        self._view = buf.subsurface((area.x % imgwidth, area.y % imgheight,
+                                     area.width, area.height))
 
     def _doTile(self):
         """Helper method to actually tile the image."""
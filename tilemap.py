@@ -2,17 +2,124 @@ from gameloop import Game, GameLoop
 from spritesheet import SpriteSheet
 from entity import Image
 from util import Struct
-import point
+from collections import OrderedDict
+import array, struct, sys, weakref
+import pathfinding, point, shape, spatial
+
+try:
+    import numpy
+    from pygame import surfarray
+except ImportError:
+    numpy = None
 
 __doc__ = """A spritesheet-based tilemap
 
              L{tilemap} has a single class, L{TileMap} (note the capitalization!)
              that defines a simple tilemap based on a spritesheet (specifially,
-             a L{SpriteSheet} object).
+             a L{SpriteSheet} object). Maps can be stored in a compact binary
+             format (see L{TileMap.writeMapFile}), which is memory-mapped when
+             it is loaded if NumPy is available.
              """
 
 __all__ = ['TileMap']
 
+class _Tile(Image):
+    """A single tile of a L{TileMap}.
+
+       Tiles aren't drawn (the map draws them in chunks), so these are only
+       made when something asks for one, to stand in for it in collisions.
+       Rays are tested against the map as a whole (which walks its grid),
+       so the tiles themselves never report ray hits.
+    """
+    def _rayHits(self, origin, direction, maxDistance, first=True):
+        return []
+
+class _TileInfo(Struct):
+    """What L{TileMap.at} finds: a tile's C{index}, C{column}, and C{row}.
+       The sprite standing in for the tile is only made if C{tile} is looked
+       at."""
+    def __init__(self, tilemap, **entries):
+        super(_TileInfo, self).__init__(**entries)
+        self._map = tilemap
+
+    def __repr__(self):
+        return 'Struct(index=%r, column=%r, row=%r)' % (self.index, self.column, self.row)
+
+    @property
+    def tile(self):
+        if self.index is None:
+            return None
+        return self._map._tileSprite(self.column, self.row)
+
+class _Chunk(Image):
+    """A block of a L{TileMap}'s tiles, drawn as a single image.
+
+       A chunk's image is only baked when it is drawn, and the map can throw
+       it away again (to be baked again later) if too many are baked at once.
+       Chunks are only drawn; collisions and rays are handled by the map.
+    """
+    def __init__(self, key, x, y, w, h):
+        # the image is the map's, so the chunk has no pixels of its own
+        super(_Chunk, self).__init__(x=x, y=y)
+        self.key = key
+        self._w, self._h = self.rect.size = (w, h)
+        self.rect.center = (x, y)
+        self.fixed = True
+        self.collidable = False
+
+        # chunks never change by themselves, so they don't need updating
+        self._asleep = True
+
+    @property
+    def image(self):
+        return self._parent._chunkImage(self.key)
+
+    def _rayHits(self, origin, direction, maxDistance, first=True):
+        return []
+
+class _TileSprites(object):
+    """The tiles of a L{TileMap}, as a read-only dictionary of sprites keyed
+       by (column, row). Each tile's sprite is made the first time it's
+       looked up, so looking at all of them (with C{values} or C{items}) is
+       slow for a large map."""
+    def __init__(self, tilemap):
+        self._map = tilemap
+
+    def get(self, key, default=None):
+        tile = self._map._tileSprite(key[0], key[1])
+        return tile if tile is not None else default
+
+    def __getitem__(self, key):
+        tile = self._map._tileSprite(key[0], key[1])
+        if tile is None:
+            raise KeyError, key
+        return tile
+
+    def __contains__(self, key):
+        col, row = key
+        tilemap = self._map
+        if not (0 <= col < tilemap.columns and 0 <= row < tilemap.rows):
+            return False
+        return tilemap._index(col, row) != -1
+
+    def __iter__(self):
+        for rowid, row in enumerate(self._map.themap):
+            for colid, index in enumerate(row):
+                if index != -1:
+                    yield (colid, rowid)
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
 class TileMap(Image):
     """A simple tilemap created from a SpriteSheet object.
 
@@ -24,6 +131,15 @@ class TileMap(Image):
     left to right, with the sub-lists ordered from top to bottom. The special
     tile index C{-1} can be used to show that a tile is blank.
 
+    The tiles aren't sprites. Instead, they are baked into square "chunks" of
+    the map (C{chunkSize} pixels on a side), and each chunk is drawn as a
+    single sprite, so only the chunks near the camera are drawn at all. The
+    chunk sprites themselves are only made when a display list is about to
+    draw them, and are thrown away again along with their images, so making
+    a map and adding it to the world take the same time for any size of map.
+    The tile data can be read with L{at} and L{atWorldPosition}, and
+    collisions are tested against the map's grid.
+
     @note: The position of a TileMap object is that of its top-left corner,
         not its center.
 
@@ -31,20 +147,40 @@ class TileMap(Image):
     @ivar themap: A list of lists used to map tile indices to SpriteSheet tiles.
     @ivar rows: The number of rows in the final mapped image.
     @ivar columns: The number of columns in the final mapped image.
-    @ivar tiles: A dictionary containing all the mapped tiles, whose keys
-        are tuples (X,Y), where X and Y are the column and row position of
-        each tile.
-    
+    @ivar tiles: A read-only dictionary of the map's (non-blank) tiles, whose
+        keys are tuples (X,Y), where X and Y are the column and row position
+        of each tile. The values are sprites, which are only made when they
+        are looked up. Only the C{MAX_TILE_SPRITES} most recently used tile
+        sprites are kept, so looking up a tile again may give a new sprite.
+    @ivar chunks: A dictionary of the map's chunk sprites, keyed by their
+        (column, row) in the grid of chunks. Only the chunks being drawn (or
+        whose images are still baked) have sprites.
+
     @param sheet: A SpriteSheet object representing the tiles that can be used
         by this TileMap.
     @param themap: A list of map rows (each itself a list of tile indices).
+    @keyword chunkSize: The size of each chunk of the map, in pixels. (The
+        default is 256.)
+    @keyword maxBakedChunks: The most chunk images that are kept at once.
+        The chunks drawn longest ago are thrown away (and baked again if
+        they're needed) after that. This must be at least 1. (The default
+        is 64.)
     """
+
+    # the most tile sprites (made for collisions and lookups) that are kept
+    MAX_TILE_SPRITES = 256
+
     def __init__(self, sheet, themap, *args, **kwargs):
         # sheet must be a pre-existing SpriteSheet
         # TODO: make this unnecessary
         if not isinstance(sheet, SpriteSheet):
             raise ValueError, "TileMap requires a SpriteSheet"
 
+        chunkSize = kwargs.pop('chunkSize', 256)
+        self.maxBakedChunks = kwargs.pop('maxBakedChunks', 64)
+        if self.maxBakedChunks < 1:
+            raise ValueError, "At least one chunk must be kept baked"
+
         super(TileMap, self).__init__(*args, **kwargs)
 
         # the spritesheet that we'll use
@@ -54,44 +190,174 @@ class TileMap(Image):
         self.themap = themap
 
         # the size of the map in tiles
-        self.rows = len(self.themap)
-        self.columns = max([len(_) for _ in self.themap])
+        if hasattr(themap, 'shape'):
+            self.rows, self.columns = themap.shape
+        else:
+            self.rows = len(self.themap)
+            self.columns = max([len(_) for _ in self.themap])
 
         # the size of the map in pixels
         self.height = self.rows * self.sheet.spriteheight
         self.width = self.columns * self.sheet.spritewidth
 
-        # a dictionary of all the tiles in the map
-        # the keys are tuples (x,y), values are the tiles themselves
-        self.tiles = {}
-
-        borderx, bordery = self.sheet.spritewidth/2, self.sheet.spriteheight/2
-        
-        for rowid,row in enumerate(self.themap):
-            for colid,col in enumerate(row):
-                tile = Image(x=colid*self.sheet.spritewidth+self.x+borderx, \
-                             y=rowid*self.sheet.spriteheight+self.y+bordery, \
-                             w=self.sheet.spritewidth, \
-                             h=self.sheet.spriteheight)
-                tile.fixed = True
-                if col != -1:
-                    # -1 is a blank tile, we just leave it empty
-                    tile.loadSurface(self.sheet.spriteAt(col))
-                    tile.pixels.set_colorkey(self.sheet.colorkey)
-                    self.tiles[(colid,rowid)] = tile
+        # tile indices that aren't solid
+        self._clearIndices = set()
+
+        # one byte per cell, 1 for a solid tile (made when it's first needed),
+        # and a count of the changes to it, so navigation data can be thrown
+        # away when it's out of date
+        self._solid = None
+        self._solidVersion = 0
+
+        # the pathfinders and flow fields using this map, updated along with
+        # it (until they're closed, or nothing else is using them)
+        self._pathFinders = weakref.WeakSet()
+
+        # tile index -> set of (column, row) cells with that index
+        # (also made when it's first needed)
+        self._cellsByIndex = None
+
+        # the sprites standing in for tiles, made as they're needed
+        self._tileSprites = OrderedDict()
+        self.tiles = _TileSprites(self)
+
+        # the images for each tile index
+        self._tileImages = {}
+
+        # the size of a chunk, in tiles
+        self._chunkTiles = (max(1, chunkSize // self.sheet.spritewidth),
+                            max(1, chunkSize // self.sheet.spriteheight))
+
+        # chunk images, in the order they were last drawn
+        self._baked = OrderedDict()
+
+        # animated tile indices, and (for each baked chunk) where they are
+        # and which of their frames the chunk's image shows
+        self._animations = {}
+        self._animatedCells = {}
+        self._shownFrames = {}
+
+        # the chunks drawn since the last update
+        self._inView = set()
+
+        # the chunk sprites, made as they come into view (see _prepareView)
+        self.chunks = {}
+        self._viewDependent = True
+
+    def add_internal(self, group):
+        super(TileMap, self).add_internal(group)
+
+        # the chunks are drawn by every group that the map is in
+        for chunk in self.chunks.itervalues():
+            chunk.add(group)
+
+    def _prepareView(self, view):
+        """Makes sprites for the chunks that a display list is about to draw,
+           and throws away the ones that are neither drawn nor baked.
+
+           @param view: The world Rect being drawn, or None for everything.
+        """
+        wanted = self._chunksIn(view)
+        chunks, baked = self.chunks, self._baked
+        for key in wanted:
+            if key not in chunks:
+                self._makeChunk(key)
+        for key in [key for key in chunks if key not in wanted and key not in baked]:
+            self.removeChild(chunks.pop(key))
+        self._inView.update(wanted)
+
+    def _chunksIn(self, rect):
+        """Gets the (column, row) keys of the chunks under a world Rect (or
+           of all of them, if the Rect is None)."""
+        ccols, crows = self._chunkTiles
+        last = (-(-self.columns // ccols) - 1, -(-self.rows // crows) - 1)
+        scroll = self.scroll
+        if rect is None or scroll.x != 1 or scroll.y != 1:
+            # the whole map is drawn (or isn't drawn where it is)
+            cx0, cy0, cx1, cy1 = 0, 0, last[0], last[1]
+        else:
+            cw = ccols * self.sheet.spritewidth
+            ch = crows * self.sheet.spriteheight
+            left, top = self._worldBounds()[2:4]
+            cx0 = max(int((rect.left - left) // cw), 0)
+            cx1 = min(int((rect.right - 1 - left) // cw), last[0])
+            cy0 = max(int((rect.top - top) // ch), 0)
+            cy1 = min(int((rect.bottom - 1 - top) // ch), last[1])
+        return set((cx, cy) for cy in xrange(cy0, cy1 + 1)
+                            for cx in xrange(cx0, cx1 + 1))
+
+    def _makeChunk(self, key):
+        """Makes the sprite for a chunk, drawn by every group that the map
+           is in."""
+        ccols, crows = self._chunkTiles
+        tw, th = self.sheet.spritewidth, self.sheet.spriteheight
+
+        # chunks are positioned relative to the map's corner
+        c0, r0 = key[0] * ccols, key[1] * crows
+        w = min(ccols, self.columns - c0) * tw
+        h = min(crows, self.rows - r0) * th
+        chunk = _Chunk(key, c0*tw + w//2, r0*th + h//2, w, h)
+        chunk._parent = self
+        chunk._recenter()
+        self.chunks[key] = chunk
+        self.addChild(chunk)
+        return chunk
 
     def update(self):
-        """Updates the tilemap. This only does something the first time it is
-        called, because of a small quirk in the way Pyrge handles pygame's
-        drawing system."""
+        """Updates the tilemap, running its tile animations and the
+           pathfinders using it."""
         super(TileMap, self).update()
 
-        # On the first update, we need to add the tiles to the display list.
-        # This is because a pygame sprite's add() method only works on groups,
-        # and the tilemap itself is not in a group when it is first created.
-        if not self._children:
-            for tile in self.tiles.values():
-                self.addChild(tile)
+        # each animated tile index has a single clock
+        changed = []
+        for index, anim in self._animations.iteritems():
+            anim.elapsed += Game.elapsed
+            frame = anim.current
+            while anim.elapsed >= anim.durations[anim.current]:
+                anim.elapsed -= anim.durations[anim.current]
+                anim.current = (anim.current + 1) % len(anim.frames)
+            if anim.current != frame:
+                changed.append(index)
+
+        inView, self._inView = self._inView, set()
+        if changed:
+            self._redrawAnimated(changed, inView)
+
+        for finder in list(self._pathFinders):
+            finder.update()
+
+    def animateTile(self, index, frames, duration=100):
+        """Animates every tile with a given index.
+
+           All the tiles with that index show the same frame, and only the
+           ones in the chunks being drawn are redrawn when the frame changes
+           (the others are brought up to date when they're next drawn), so a
+           tile animation costs the same however many of those tiles there
+           are in the map. The map data keeps the original index.
+
+           @param index: The tile index to animate.
+           @param frames: A list of spritesheet indices, the animation frames.
+           @param duration: How long each frame is shown, in milliseconds, or
+               a list of durations, one for each frame.
+        """
+        if not hasattr(duration, '__iter__'):
+            duration = [duration] * len(frames)
+        if len(duration) != len(frames) or min(duration) <= 0:
+            raise ValueError, "Each frame needs a positive duration"
+
+        self._animations[index] = Struct(frames=list(frames),
+                                         durations=list(duration),
+                                         current=0, elapsed=0)
+        self._rebakeAll()
+
+    def stopTileAnimation(self, index):
+        """Stops animating a tile index, so its tiles show their own image
+           again.
+
+           @param index: A tile index animated with L{animateTile}.
+        """
+        if self._animations.pop(index, None) is not None:
+            self._rebakeAll()
 
     def overlap(self, other, checkAlive=False):
         """Tests whether an object intersects any tile in the map.
@@ -99,33 +365,47 @@ class TileMap(Image):
            @param other: The object that will be tested for collision.
            @return: A list of tiles that overlap the given object.
         """
-        return [t for t in self.tiles.values() if other.overlap(t)]
+        overlapping = []
+        for col, row in self._cellsUnder(other.rect):
+            tile = self._tileSprite(col, row)
+            if tile is not None and other.overlap(tile):
+                overlapping.append(tile)
+        return overlapping
 
     def collide(self, other, kill=False, checkAlive=True):
         """Performs collision detection and calls collision response methods.
 
            Specifically, this method tests for overlapping of solid tiles, and
            calls the "other" object's collision function against each tile. 
+           Only the cells under the object are looked at, so this takes the
+           same time for any size of map.
 
            @param other: The object that will be tested for collision.
-           @return: A list of overlapping tiles.
+           @return: A list of overlapping solid tiles.
         """
-        overlapping = self.overlap(other)
-
-        for tile in overlapping:
-            if tile.collidable:
-                other.collide(tile)
+        grid, columns = self._solidity(), self.columns
+        overlapping = []
+        for col, row in self._cellsUnder(other.rect):
+            if grid[row*columns + col]:
+                tile = self._tileSprite(col, row)
+                if other.overlap(tile):
+                    overlapping.append(tile)
+                    other.collide(tile)
 
         return overlapping
 
     def at(self, xpos, ypos=None):
         """Gets the tile at a given coordinate.
 
-           @return: A L{Struct} with two attributes:
-                - tile : A copy of the tile at a specific location on the map,
-                    or None if the given position is outside the boundaries of the map.
-                - index : The tile's index on the tilemap's spritesheet, or -1
-                    for a blank tile.
+           @return: A L{Struct} with these attributes:
+                - index : The tile's index on the tilemap's spritesheet, -1
+                    for a blank tile, or None if the given position is outside
+                    the boundaries of the map.
+                - column, row : The position looked at.
+                - tile : A sprite standing in for the tile, or None for a
+                    blank tile or a position outside the map. This is only
+                    made when it is looked at, so reading C{index} alone is
+                    cheap.
         """
         if ypos is None:
             ypos, xpos = divmod(xpos, self.columns)
@@ -133,10 +413,10 @@ class TileMap(Image):
         if xpos < 0 or ypos < 0 or xpos >= self.columns or ypos >= self.rows:
             _tileid = None
         else:
-            _tileid = self.themap[int(ypos)][int(xpos)]
+            xpos, ypos = int(xpos), int(ypos)
+            _tileid = self._index(xpos, ypos)
 
-        _tile = self.tiles.get((xpos,ypos),None)
-        return Struct(index=_tileid, tile=_tile)
+        return _TileInfo(self, index=_tileid, column=xpos, row=ypos)
 
     def atWorldPosition(self, xpos, ypos):
         """Gets the tile at a specific world-based coordinate.
@@ -155,6 +435,82 @@ class TileMap(Image):
         ty = (ypos - top) // self.sheet.spriteheight
         return self.at(tx,ty)
 
+    def raycast(self, start, direction, maxDistance=None):
+        """Finds the first solid tile hit by a ray.
+
+           @param start: The start of the ray, in world coordinates.
+           @param direction: The direction of the ray (any length but zero).
+           @param maxDistance: The length of the ray, or None for no limit.
+           @return: A L{Struct} with C{target} (this map), C{distance},
+               C{point}, C{tile} (the (column,row) of the tile hit), and
+               C{index} attributes, or None if no solid tile was hit.
+        """
+        hits = self._rayHits(start, point.Vector(direction).normalized(),
+                             maxDistance, True)
+        return hits[0] if hits else None
+
+    def raycastAll(self, start, direction, maxDistance=None):
+        """Finds all the solid tiles hit by a ray, closest first.
+
+           @return: A list of hits, as returned by L{raycast}.
+        """
+        return self._rayHits(start, point.Vector(direction).normalized(),
+                             maxDistance, False)
+
+    def _worldBounds(self):
+        # the position of a map is its top-left corner
+        left, top = self.x, self.y
+        if self._parent is not None:
+            left += self._parent.x
+            top += self._parent.y
+        right, bottom = left + self.width, top + self.height
+        return ((left + right) / 2., (top + bottom) / 2., left, top, right, bottom)
+
+    def _rayHits(self, origin, direction, maxDistance, first=True):
+        """Walks a ray through the map grid, one tile at a time."""
+        tw, th = self.sheet.spritewidth, self.sheet.spriteheight
+        left, top = self._worldBounds()[2:4]
+        ox, oy = origin[0] - left, origin[1] - top
+        dx, dy = direction[0], direction[1]
+        if maxDistance is None:
+            maxDistance = float('inf')
+
+        span = shape.clipRay(ox, oy, dx, dy, 0, 0, self.columns * tw,
+                             self.rows * th, maxDistance)
+        if span is None:
+            return []
+        t, tend = span
+
+        col = min(max(int((ox + dx*t) // tw), 0), self.columns - 1)
+        row = min(max(int((oy + dy*t) // th), 0), self.rows - 1)
+        stepc, tnextc, tdeltac = spatial._ddaAxis(ox, dx, col, tw)
+        stepr, tnextr, tdeltar = spatial._ddaAxis(oy, dy, row, th)
+
+        hits = []
+        grid, columns = self._solidity(), self.columns
+        while True:
+            if grid[row*columns + col]:
+                hits.append(Struct(target=self, distance=t,
+                                   point=point.Vector(origin[0] + dx*t,
+                                                      origin[1] + dy*t),
+                                   tile=(col, row), index=self._index(col, row)))
+                if first:
+                    break
+
+            t = min(tnextc, tnextr)
+            if t > tend:
+                break
+            if tnextc < tnextr:
+                col += stepc
+                tnextc += tdeltac
+            else:
+                row += stepr
+                tnextr += tdeltar
+            if not (0 <= col < self.columns and 0 <= row < self.rows):
+                break
+
+        return hits
+
     def setSolidTiles(self, indices):
         """Sets a list of tiles to be solid.
 
@@ -162,20 +518,391 @@ class TileMap(Image):
 
            @param indices: A list of spritesheet indices to be made solid.
         """
-        for tile in self.tiles:
-            if self.at(*tile).index in indices:
-                self.tiles[tile].collidable = True
+        self._clearIndices.difference_update(indices)
+        self._setSolidity(indices, 1)
+        for tile in self._tileSprites.values():
+            if tile.index in indices:
+                tile.collidable = True
 
     def setClearTiles(self, indices):
         """Sets a list of tiles to be "clear" (i.e., not solid).
 
            @param indices: A list of spritesheet indices to be made clear.
         """
+        self._clearIndices.update(indices)
+        self._setSolidity(indices, 0)
+        for tile in self._tileSprites.values():
+            if tile.index in indices:
+                tile.collidable = False
+
+    def _setSolidity(self, indices, solid):
+        """Sets the solidity of every cell with one of a list of indices,
+           using the reverse index (so the rest of the map isn't looked at)."""
+        self._solidVersion += 1
+        grid = self._solid
+        if grid is None:
+            # it will be made with the right values
+            return
+        columns = self.columns
+        for index in indices:
+            for col, row in self.findTiles(index):
+                grid[row*columns + col] = solid
+
+    def findTiles(self, index, center=None, radius=None):
+        """Finds all the tiles of one type.
+
+           The map keeps a reverse index of where each type of tile is, so this
+           takes time proportional to the number of tiles found (or, when
+           looking near a point, the number of that type in the whole map),
+           not to the size of the map.
+
+           @param index: The tile index to look for.
+           @param center: If given, only tiles whose centers are within
+               C{radius} pixels of this point (in world coordinates) are found.
+           @param radius: The distance from C{center} to look.
+           @return: A list of the (column, row) of each tile.
+        """
+        cells = self._cellIndex().get(index, ())
+        if center is None:
+            return list(cells)
+
+        tw, th = self.sheet.spritewidth, self.sheet.spriteheight
+        left, top = self._worldBounds()[2:4]
+        cx, cy = center[0] - left - tw/2., center[1] - top - th/2.
+        r2 = radius * radius
+        return [(col, row) for col, row in cells
+                if (col*tw - cx)**2 + (row*th - cy)**2 <= r2]
+
+    def flowField(self, goal, **kwargs):
+        """Finds the way to a goal from every cell of the map, so any number of
+           sprites can head for the same place without each finding its own
+           path.
+
+           @param goal: The (column, row) of the goal cell.
+           @return: A L{FlowField}. Any keyword arguments are passed on to its
+               constructor.
+        """
+        return pathfinding.FlowField(self, goal, **kwargs)
+
+    def _cellIndex(self):
+        """Gets the reverse index, mapping each tile index to the set of
+           (column, row) cells holding it. Blank tiles aren't indexed."""
+        cellsByIndex = self._cellsByIndex
+        if cellsByIndex is None:
+            cellsByIndex = {}
+            themap, columns = self.themap, self.columns
+            if numpy is not None and isinstance(themap, numpy.ndarray):
+                # group the cells by sorting them on their indices
+                flat = themap.ravel()
+                order = numpy.argsort(flat, kind='mergesort')
+                ordered = flat[order]
+                bounds = numpy.flatnonzero(numpy.diff(ordered)) + 1
+                starts = [0] + bounds.tolist()
+                ends = bounds.tolist() + [len(ordered)]
+                for start, end in zip(starts, ends):
+                    index = int(ordered[start])
+                    if index != -1:
+                        cells = order[start:end]
+                        cellsByIndex[index] = set(zip((cells % columns).tolist(),
+                                                      (cells // columns).tolist()))
+            else:
+                for rowid, row in enumerate(themap):
+                    for colid, index in enumerate(row):
+                        if index != -1:
+                            cellsByIndex.setdefault(index, set()).add((colid, rowid))
+            self._cellsByIndex = cellsByIndex
+        return cellsByIndex
+
+    def setTile(self, col, row, index):
+        """Changes one tile of the map.
+
+           Only the changed tile is redrawn (in its chunk's image), so this is
+           cheap enough to use for digging, building, and so on.
+
+           @param col: The column of the tile.
+           @param row: The row of the tile.
+           @param index: The new tile index, or -1 for a blank tile.
+           @return: Whether the tile was changed. (Positions outside the map
+               can't be changed.)
+        """
+        return self.setRegion(col, row, [[index]]) > 0
+
+    def setRegion(self, col, row, grid):
+        """Changes a rectangular block of tiles.
+
+           Each chunk of the map that the block covers is redrawn only where
+           its tiles were changed. Parts of the block outside the map are
+           ignored.
+
+           @param col: The column of the block's top-left corner.
+           @param row: The row of the block's top-left corner.
+           @param grid: The new tile indices, as a list of rows (or an array).
+           @return: The number of tiles that were changed.
+        """
+        ccols, crows = self._chunkTiles
+        changed = {}
+        for r, newrow in enumerate(grid, row):
+            if not 0 <= r < self.rows:
+                continue
+            if hasattr(newrow, 'tolist'):
+                newrow = newrow.tolist()
+            for c, index in enumerate(newrow, col):
+                if 0 <= c < self.columns and self._setCell(c, r, index):
+                    changed.setdefault((c // ccols, r // crows), []).append((c, r))
+
+        for key, cells in changed.iteritems():
+            self._redrawCells(key, cells)
+        return sum(len(cells) for cells in changed.itervalues())
+
+    def _setCell(self, col, row, index):
+        """Changes the map data for one tile, without redrawing it.
+
+           @return: Whether the tile was changed.
+        """
+        maprow = self.themap[row]
+        if col >= len(maprow):
+            # a short row of a list map
+            maprow.extend([-1] * (col + 1 - len(maprow)))
+        old = maprow[col]
+        if old == index:
+            return False
+        maprow[col] = index
+
+        cellsByIndex = self._cellsByIndex
+        if cellsByIndex is not None:
+            if old != -1:
+                cellsByIndex[old].discard((col, row))
+            if index != -1:
+                cellsByIndex.setdefault(index, set()).add((col, row))
+
+        clear = self._clearIndices
+        solid = index != -1 and index not in clear
+        if solid != (old != -1 and old not in clear):
+            self._solidVersion += 1
+        if self._solid is not None:
+            self._solid[row*self.columns + col] = 1 if solid else 0
+
+        # the old tile's sprite (if there is one) is out of date
+        self._tileSprites.pop((col, row), None)
+        return True
+
+    def _redrawCells(self, key, cells):
+        """Redraws some of the tiles in a chunk's image, if it is baked."""
+        image = self._baked.get(key)
+        if image is not None:
+            tw, th = self.sheet.spritewidth, self.sheet.spriteheight
+            ccols, crows = self._chunkTiles
+            c0, r0 = key[0] * ccols, key[1] * crows
+            self._syncAnimated(key, image)
+            animated = self._animatedCells.setdefault(key, {})
+            shown = self._shownFrames.setdefault(key, {})
+            for col, row in cells:
+                pos = ((col - c0) * tw, (row - r0) * th)
+                image.fill((0,0,0,0), (pos, (tw, th)))
+                index = self._index(col, row)
+                for others in animated.itervalues():
+                    others.discard((col, row))
+                if index != -1:
+                    if index in self._animations:
+                        animated.setdefault(index, set()).add((col, row))
+                        shown[index] = self._frameOf(index)
+                    image.blit(self._tileImage(self._frameOf(index)), pos)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            chunk.redraw()
+
+    def _index(self, col, row):
+        """Gets the tile index at a position in the map, or -1 if it's blank
+           (or past the end of a short row)."""
+        try:
+            return int(self.themap[row][col])
+        except IndexError:
+            return -1
+
+    def isSolid(self, col, row):
+        """Tests whether there is a solid tile at a position in the map.
+
+           @param col: The column of the map.
+           @param row: The row of the map.
+           @return: True if the tile is solid, or False if it is clear, blank,
+               or outside the map.
+        """
+        if not (0 <= col < self.columns and 0 <= row < self.rows):
+            return False
+        return self._solidity()[row*self.columns + col] == 1
+
+    def _solidity(self):
+        """Gets the solidity grid: a bytearray with one entry for each cell
+           of the map (row by row), 1 for a solid tile and 0 otherwise."""
+        grid = self._solid
+        if grid is None:
+            columns, clear = self.columns, self._clearIndices
+            themap = self.themap
+            if numpy is not None and isinstance(themap, numpy.ndarray):
+                solid = themap != -1
+                if clear:
+                    solid &= ~numpy.in1d(themap, list(clear)).reshape(themap.shape)
+                grid = bytearray(solid.astype(numpy.uint8).tostring())
+            else:
+                grid = bytearray(self.rows * columns)
+                for rowid, row in enumerate(themap):
+                    base = rowid * columns
+                    for colid, index in enumerate(row):
+                        if index != -1 and index not in clear:
+                            grid[base + colid] = 1
+            self._solid = grid
+        return grid
+
+    def _cellsUnder(self, rect):
+        """Gets the (column, row) of each cell of the map under a world
+           Rect."""
+        tw, th = self.sheet.spritewidth, self.sheet.spriteheight
+        left, top = self._worldBounds()[2:4]
+        c0 = max(int((rect.left - left) // tw), 0)
+        c1 = min(int((rect.right - 1 - left) // tw), self.columns - 1)
+        r0 = max(int((rect.top - top) // th), 0)
+        r1 = min(int((rect.bottom - 1 - top) // th), self.rows - 1)
+        return [(col, row) for row in xrange(r0, r1 + 1)
+                           for col in xrange(c0, c1 + 1)]
+
+    def _tileSprite(self, col, row):
+        """Gets the sprite standing in for a tile, making it if needed, or
+           None for a blank tile."""
+        if not (0 <= col < self.columns and 0 <= row < self.rows):
+            return None
+        key = (col, row)
+        tiles = self._tileSprites
+        try:
+            tile = tiles.pop(key)
+        except KeyError:
+            index = self._index(col, row)
+            if index == -1:
+                return None
+            tw, th = self.sheet.spritewidth, self.sheet.spriteheight
+
+            # tiles are positioned relative to the map's corner
+            tile = _Tile(x=col*tw + tw/2, y=row*th + th/2, w=tw, h=th)
+            tile._parent = self
+            tile.fixed = True
+            tile.index = index
+            tile.loadSurface(self._tileImage(self._frameOf(index)))
+            tile.collidable = index not in self._clearIndices
+            while len(tiles) >= self.MAX_TILE_SPRITES:
+                tiles.popitem(last=False)
+
+        # the most recently used tiles are kept
+        tiles[key] = tile
+
+        # the map might have moved since the tile was made
+        tile._recenter()
+        return tile
+
+    def _tileImage(self, index):
+        """Gets the image of a tile index from the spritesheet."""
+        image = self._tileImages.get(index)
+        if image is None:
+            image = self.sheet.spriteAt(int(index))
+            image.set_colorkey(self.sheet.colorkey)
+            self._tileImages[index] = image
+        return image
+
+    def _chunkImage(self, key):
+        """Gets the image of a chunk, baking it if needed."""
+        baked = self._baked
+        image = baked.pop(key, None)
+        if image is None:
+            image = self._bakeChunk(key[0], key[1])
+            while baked and len(baked) >= self.maxBakedChunks:
+                oldest = baked.popitem(last=False)[0]
+                self._animatedCells.pop(oldest, None)
+                self._shownFrames.pop(oldest, None)
+        else:
+            self._syncAnimated(key, image)
+        baked[key] = image
+        return image
+
+    def _bakeChunk(self, cx, cy):
+        """Draws the tiles of one chunk of the map onto a single image."""
+        tw, th = self.sheet.spritewidth, self.sheet.spriteheight
+        ccols, crows = self._chunkTiles
+        c0, r0 = cx * ccols, cy * crows
+        cols = min(ccols, self.columns - c0)
+        rows = min(crows, self.rows - r0)
 
-        for tile in self.tiles:
-            if self.at(*tile).index in indices:
-                self.tiles[tile].collidable = False
-            
+        animations = self._animations
+        animated = {}
+
+        surface = Game.Surface((cols*tw, rows*th), Game.Constants.SRCALPHA, 32)
+        surface.fill((0,0,0,0))
+        for row in xrange(rows):
+            maprow = self.themap[r0 + row][c0:c0 + cols]
+            if hasattr(maprow, 'tolist'):
+                # a row of an array
+                maprow = maprow.tolist()
+            for col, index in enumerate(maprow):
+                if index != -1:
+                    if index in animations:
+                        animated.setdefault(index, set()).add((c0 + col, r0 + row))
+                    surface.blit(self._tileImage(self._frameOf(index)), (col*tw, row*th))
+
+        if animated:
+            self._animatedCells[(cx,cy)] = animated
+            self._shownFrames[(cx,cy)] = dict((index, self._frameOf(index))
+                                              for index in animated)
+        return surface
+
+    def _frameOf(self, index):
+        """Gets the spritesheet index shown by a tile index right now."""
+        anim = self._animations.get(index)
+        return anim.frames[anim.current] if anim is not None else index
+
+    def _redrawAnimated(self, indices, inView):
+        """Marks the chunks in view that show some animated indices to be
+           redrawn. Their images are brought up to date as they're drawn.
+
+           @param indices: The animated tile indices whose frames changed.
+           @param inView: The keys of the chunks drawn since the last update.
+        """
+        for key in inView:
+            animated = self._animatedCells.get(key)
+            if not animated:
+                continue
+            for index in indices:
+                if animated.get(index):
+                    chunk = self.chunks.get(key)
+                    if chunk is not None:
+                        chunk.redraw()
+                    break
+
+    def _syncAnimated(self, key, image):
+        """Redraws the animated tiles of a baked chunk whose images don't
+           show their index's current frame."""
+        animated = self._animatedCells.get(key)
+        if not animated:
+            return
+        shown = self._shownFrames[key]
+        tw, th = self.sheet.spritewidth, self.sheet.spriteheight
+        ccols, crows = self._chunkTiles
+        c0, r0 = key[0] * ccols, key[1] * crows
+        for index, cells in animated.iteritems():
+            frame = self._frameOf(index)
+            if not cells or shown.get(index) == frame:
+                continue
+            tile = self._tileImage(frame)
+            for col, row in cells:
+                pos = ((col - c0) * tw, (row - r0) * th)
+                image.fill((0,0,0,0), (pos, (tw, th)))
+                image.blit(tile, pos)
+            shown[index] = frame
+
+    def _rebakeAll(self):
+        """Throws away all the baked chunk images, so they are baked again
+           as they're drawn."""
+        self._baked.clear()
+        self._animatedCells.clear()
+        self._shownFrames.clear()
+        for chunk in self.chunks.itervalues():
+            chunk.redraw()
 
     @classmethod
     def fromString(cls, sheet, mapstring, *args, **kwargs):
@@ -198,6 +925,10 @@ class TileMap(Image):
     def fromImage(cls, sheet, image, colors, *args, **kwargs):
         """Creates a new tilemap from an image.
 
+           If NumPy is available, the whole image is converted at once, and the
+           map is a NumPy array of tile indices. Otherwise, each pixel is
+           looked up separately, which is much slower for a large image.
+
            @param sheet: The SpriteSheet to use when creating the TileMap.
            @param image: The image to use as the basis for the TileMap.
            @param colors: A dictionary mapping color values to tile indices.
@@ -206,7 +937,10 @@ class TileMap(Image):
                be RGB or RGBA tuples.
         """
         if isinstance(image, basestring):
-            image = Game.Image.load(image)
+            image = Game.loadImage(image)
+
+        if numpy is not None:
+            return cls(sheet, cls._colorsToIndices(image, colors), *args, **kwargs)
 
         rows = []
         pxarray = Game.PixelArray(image)
@@ -222,3 +956,143 @@ class TileMap(Image):
             rows.append(thisRow)
 
         return cls(sheet, rows, *args, **kwargs)
+
+    @staticmethod
+    def _colorsToIndices(image, colors):
+        """Maps the colors of an image to tile indices, using NumPy.
+
+           Each pixel's color is packed into a single integer, and these are
+           looked up in sorted arrays of the packed colors of the dictionary.
+           An RGBA key takes precedence over an RGB one, as in the
+           pixel-by-pixel version.
+
+           @return: An array of tile indices, indexed by [row][column].
+        """
+        rgb = surfarray.array3d(image).astype(numpy.uint32)
+        packed = (rgb[...,0] << 16) | (rgb[...,1] << 8) | rgb[...,2]
+        packed = (packed << 8) | surfarray.array_alpha(image)
+
+        # surfarrays are indexed by [x][y], but maps are rows of tiles
+        packed = packed.T
+
+        values = [v for v in colors.itervalues()] or [-1]
+        dtype = numpy.int16 if -32768 <= min(values) and max(values) < 32768 \
+                else numpy.int32
+        indices = numpy.empty(packed.shape, dtype)
+        indices.fill(-1)
+
+        def lookup(keys, pixels):
+            if not keys:
+                return
+            keys.sort()
+            packedKeys = numpy.array([k for k,v in keys], numpy.uint32)
+            tiles = numpy.array([v for k,v in keys], dtype)
+            pos = numpy.searchsorted(packedKeys, pixels).clip(0, len(keys) - 1)
+            found = packedKeys[pos] == pixels
+            indices[found] = tiles[pos[found]]
+
+        rgbKeys, rgbaKeys = [], []
+        for color, index in colors.iteritems():
+            r,g,b = color[0], color[1], color[2]
+            key = (r << 16) | (g << 8) | b
+            if len(color) > 3:
+                rgbaKeys.append(((key << 8) | color[3], index))
+            else:
+                rgbKeys.append((key, index))
+        lookup(rgbKeys, packed >> 8)
+        lookup(rgbaKeys, packed)
+        return indices
+
+    ###
+    # Binary map files
+    # A map file is a header (the magic string, then the number of columns,
+    # rows, and layers as little-endian 32-bit integers), followed by each
+    # layer's grid of tile indices, row by row, as little-endian 16-bit
+    # integers.
+    ###
+
+    _fileMagic = 'PYRGMAP1'
+    _fileHeader = struct.Struct('<8sIII')
+
+    @classmethod
+    def fromFile(cls, sheet, filename, layer=0, *args, **kwargs):
+        """Creates a new tilemap from one layer of a binary map file.
+
+           If NumPy is available, the file is memory-mapped, and the map uses
+           it directly, so even a huge map loads almost instantly, and takes
+           two bytes per tile. (Changes to the map aren't written back to the
+           file.) Otherwise, the layer is read into lists.
+
+           @param sheet: The SpriteSheet to use when creating the TileMap.
+           @param filename: The name of a file written by L{writeMapFile}
+               (or L{saveFile}).
+           @param layer: The number of the layer to use.
+           @return: A new TileMap object.
+        """
+        return cls(sheet, cls.readMapFile(filename)[layer], *args, **kwargs)
+
+    def saveFile(self, filename):
+        """Writes this map to a binary map file, as a single layer.
+
+           @param filename: The name of the file.
+        """
+        self.writeMapFile(filename, self.themap)
+
+    @staticmethod
+    def readMapFile(filename):
+        """Reads the layers of a binary map file.
+
+           @param filename: The name of the file.
+           @return: A list of layers, each a grid of tile indices. With NumPy,
+               these are (copy-on-write) memory-mapped arrays; without it,
+               they are lists of rows.
+        """
+        header = TileMap._fileHeader
+        f = open(filename, 'rb')
+        try:
+            magic, columns, rows, layers = header.unpack(f.read(header.size))
+            if magic != TileMap._fileMagic:
+                raise ValueError, "Not a Pyrge map file"
+
+            if numpy is not None:
+                grids = numpy.memmap(f, numpy.dtype('<i2'), 'c', header.size,
+                                     (layers, rows, columns))
+                return [grids[i] for i in xrange(layers)]
+
+            grids = []
+            for i in xrange(layers):
+                cells = array.array('h')
+                cells.fromfile(f, rows * columns)
+                if sys.byteorder != 'little':
+                    cells.byteswap()
+                grids.append([cells[r*columns:(r+1)*columns].tolist()
+                              for r in xrange(rows)])
+            return grids
+        finally:
+            f.close()
+
+    @staticmethod
+    def writeMapFile(filename, *layers):
+        """Writes a binary map file.
+
+           @param filename: The name of the file.
+           @param layers: Any number of layers, each a grid (a list of rows,
+               or an array) of tile indices. Short rows are padded with blank
+               tiles, and smaller layers are padded to the size of the
+               largest.
+        """
+        rows = max(len(layer) for layer in layers)
+        columns = max(len(row) for layer in layers for row in layer)
+        f = open(filename, 'wb')
+        try:
+            f.write(TileMap._fileHeader.pack(TileMap._fileMagic, columns,
+                                             rows, len(layers)))
+            for layer in layers:
+                for r in xrange(rows):
+                    row = list(layer[r]) if r < len(layer) else []
+                    cells = array.array('h', row + [-1] * (columns - len(row)))
+                    if sys.byteorder != 'little':
+                        cells.byteswap()
+                    cells.tofile(f)
+        finally:
+            f.close()
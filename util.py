@@ -2,7 +2,7 @@ import math, point
 
 __doc__ = """Useful utility classes and functions for working with Pyrge."""
 
-__all__ = ['Struct', 'sign', 'vectorFromAngle']
+__all__ = ['Struct', 'Directions', 'sign', 'vectorFromAngle']
 
 class Struct(object):
     """A simple struct class that can be initialized by keyword arguments."""
@@ -13,6 +13,49 @@ class Struct(object):
         args = ['%s=%s' % (k, repr(v)) for (k,v) in vars(self).items()]
         return 'Struct(%s)' % ', '.join(args)
 
+class Directions(object):
+    """A read-only set of collision direction flags.
+
+       Directions objects are shared, since there are only sixteen possible
+       combinations of the four flags. Instead of creating a new one, look it
+       up in the C{Directions.ALL} table using the bitwise OR of the C{LEFT},
+       C{RIGHT}, C{TOP}, and C{BOTTOM} constants.
+
+       @ivar flags: The bitwise OR of the direction constants.
+       @ivar left: Whether the left side is included.
+       @ivar right: Whether the right side is included.
+       @ivar top: Whether the top is included.
+       @ivar bottom: Whether the bottom is included.
+    """
+    __slots__ = ('flags', 'left', 'right', 'top', 'bottom')
+
+    # direction bits
+    LEFT = 1
+    RIGHT = 2
+    TOP = 4
+    BOTTOM = 8
+
+    def __init__(self, flags=0):
+        setter = super(Directions, self).__setattr__
+        setter('flags', flags)
+        setter('left', bool(flags & Directions.LEFT))
+        setter('right', bool(flags & Directions.RIGHT))
+        setter('top', bool(flags & Directions.TOP))
+        setter('bottom', bool(flags & Directions.BOTTOM))
+
+    def __setattr__(self, name, value):
+        raise AttributeError, "Directions objects are read-only"
+
+    def __nonzero__(self):
+        return self.flags != 0
+
+    def __repr__(self):
+        return 'Directions(left=%s, right=%s, top=%s, bottom=%s)' % \
+               (self.left, self.right, self.top, self.bottom)
+
+# one shared object for each combination of direction flags
+Directions.ALL = tuple(Directions(f) for f in xrange(16))
+
 def sign(x):
     """Returns a value based on the sign of a number
        (positive=1, negative=-1, zero=0)."""
@@ -1,4 +1,4 @@
-import gameloop, point
+import gameloop, point, preload
 from gameloop import Game
 from util import Struct
 
@@ -10,13 +10,28 @@ scrolling (including parallax scrolling) and camera control (i.e., an object,
 usually the player, can be designated as the "focus", so the game engine always
 tries to center the display on that object)."""
 
-__all__ = ['World', 'Stage']
+__all__ = ['World', 'Stage', 'Viewport']
 
 class World(gameloop.GameLoop):
     """A game world that can be larger than the screen size.
 
        @ivar camera: The current position in the game world of the camera.
        @ivar focus: The object currently being followed by the camera.
+       @ivar culling: Whether sprites far outside the camera's view are
+           skipped when drawing (the default is True).
+       @ivar cullMargin: How far outside the screen, in pixels, a sprite can
+           be and still be drawn.
+       @ivar scrollBlit: Whether camera moves are drawn by scrolling the last
+           frame and redrawing only its new edges and the sprites that
+           changed (the default is False). This is much faster for slowly
+           panning levels, but needs a solid background color, so it isn't
+           used while there are parallax layers.
+       @ivar streamer: A L{ChunkManager} that loads and unloads the parts of
+           the world near the camera, or None if the whole world is always
+           in memory.
+       @ivar viewports: The L{Viewport}s the world is drawn in (see
+           L{addViewport}). If there are none, the whole screen shows the
+           view from the main camera.
 
        @keyword width: The width of the screen.
        @keyword height: The height of the screen.
@@ -52,6 +67,24 @@ class World(gameloop.GameLoop):
         # or stages are not being used
         self._activeStage = None
 
+        # only draw the sprites near the camera's view
+        self.culling = True
+
+        # how far outside the screen a sprite can be and still be drawn
+        self.cullMargin = 64
+
+        # scroll the last frame when the camera moves
+        self.scrollBlit = False
+
+        # the activity regions, as (near, mid, rate), or None
+        self._activityRegions = None
+
+        # the chunk manager for a streamed world
+        self.streamer = None
+
+        # the views of a split screen
+        self.viewports = []
+
     # set a specific object as the camera's focus
     def follow(self, o, lead=None):
         """Sets the camera to follow a specific object.
@@ -105,6 +138,29 @@ class World(gameloop.GameLoop):
         """Returns a Point object representing the center of the screen."""
         return point.Point(self.getScreenRect().center)
 
+    def screenToWorld(self, pos, scroll=(1,1)):
+        """Finds the position in the world shown at a point on the screen.
+           While there are viewports, the camera of the one containing the
+           point is used.
+
+           @param pos: A position on the screen, as an (x,y) tuple, before
+               the game's graphics are scaled (so a mouse position must be
+               divided by C{scale} first).
+           @param scroll: The scroll factor of the sprites being looked for.
+           @return: A L{Point} in world coordinates, or None if the point is
+               outside every viewport.
+        """
+        if not self.viewports:
+            return super(World, self).screenToWorld(pos, scroll)
+
+        for viewport in self.viewports:
+            if viewport.rect.collidepoint(pos):
+                # the same camera that _draw uses for the viewport
+                view = viewport.getWorldRect()
+                return point.Point(pos[0] + (view.x - viewport.rect.x) * scroll[0],
+                                   pos[1] + (view.y - viewport.rect.y) * scroll[1])
+        return None
+
     def getBounds(self):
         """Gets a Rect object containing the camera boundaries."""
         return self._bounds
@@ -120,18 +176,139 @@ class World(gameloop.GameLoop):
                               bounds.width+border*2, border)
         oobbottom = Game.Rect(bounds.left-border, bounds.bottom,\
                               bounds.width+border*2, border)
-        l = [r.move(-Game.scroll.x, -Game.scroll.y) for r in \
-             oobleft, oobright, oobtop, oobbottom]
-
-        return Struct(left=l[0], right=l[1], top=l[2], bottom=l[3])
+        return Struct(left=oobleft, right=oobright, top=oobtop, bottom=oobbottom)
 
     def update(self):
         """Updates the world for each frame."""
         if self.focus:
             Game.camera = self.camera = self.focus.position
             self._doCameraFollow()
+
+        for viewport in self.viewports:
+            viewport._doCameraFollow(self)
+
+        screen = self.getScreenRect()
+        if self.culling:
+            margin = self.cullMargin
+            self._entities.view = Game.Rect(Game.scroll.x - margin,
+                                            Game.scroll.y - margin,
+                                            screen.width + 2*margin,
+                                            screen.height + 2*margin)
+        else:
+            self._entities.view = None
+        self._entities.scrollBlit = self.scrollBlit and not self.viewports
+
+        if self.viewports:
+            center = [v.getWorldRect().center for v in self.viewports]
+        else:
+            center = (Game.scroll.x + screen.width / 2.,
+                      Game.scroll.y + screen.height / 2.)
+        if self.streamer is not None:
+            self.streamer.update(center)
+
+        activity = None
+        if self._activityRegions is not None:
+            activity = (center,) + self._activityRegions
+        self._entities.activity = activity
+        if self.activeStage is not None:
+            # the active stage does the updating (see changeStage)
+            self.activeStage.activity = activity
+
         super(World, self).update()
 
+    def setActivityRegions(self, near=None, mid=None, rate=4):
+        """Sets how far from the camera entities are kept active.
+
+           Entities with any part within C{near} pixels of the center of the
+           screen are updated every frame, so a large entity (such as a tile
+           map) is active whenever part of it is near. Those within C{mid}
+           pixels are updated every C{rate} frames, moving C{rate} frames'
+           worth each time. Entities beyond that are frozen until the camera comes near
+           them again. Entities that don't scroll with the camera (such as
+           backgrounds and HUDs) are always updated.
+
+           Calling this with no arguments updates every entity again.
+
+           @param near: The radius of the fully active region, or None to
+               turn off activity regions.
+           @param mid: The radius of the reduced-rate region, or None to
+               have no reduced-rate region.
+           @param rate: How often the reduced-rate region is updated.
+        """
+        if near is None:
+            self._activityRegions = None
+        else:
+            if mid is not None and rate <= 1:
+                # every frame is full rate, so this is all one region
+                near, mid = max(near, mid), None
+            self._activityRegions = (near, mid, rate)
+
+    def addViewport(self, rect, focus=None):
+        """Adds a viewport, splitting the screen. While there are any
+           viewports, the world is drawn once for each of them, from its own
+           camera, into its own part of the screen, and the rest of the
+           screen is left alone. The sprites are still only updated once
+           per frame.
+
+           @param rect: The area of the screen that the viewport covers.
+           @param focus: The object that the viewport's camera follows.
+           @return: The new L{Viewport}.
+        """
+        viewport = Viewport(rect, focus)
+        self.viewports.append(viewport)
+        return viewport
+
+    def removeViewport(self, viewport):
+        """Removes a viewport. Once the last one is removed, the whole
+           screen shows the main camera's view again.
+
+           @param viewport: A L{Viewport} that was added with
+               L{addViewport}.
+        """
+        self.viewports.remove(viewport)
+        if not self.viewports:
+            self._entities.set_clip()
+        return self
+
+    def _draw(self):
+        """Draws the world onto the screen, once for each viewport."""
+        if not self.viewports:
+            return super(World, self)._draw()
+
+        entities = self._entities
+        entities.clear(self.screen, self.background)
+        margin = self.cullMargin
+        rects = []
+        for viewport in self.viewports:
+            view = viewport.getWorldRect()
+            entities.view = view.inflate(2*margin, 2*margin) if self.culling else None
+
+            # a viewport's camera shows its corner of the world at
+            # its corner of the screen
+            entities.camera = (view.x - viewport.rect.x, view.y - viewport.rect.y)
+            entities.set_clip(viewport.rect)
+            rects.extend(entities.draw(self.screen))
+        return rects
+
+    def addParallaxLayer(self, layer):
+        """Adds a background layer, in front of any that have already been
+           added (but behind every sprite).
+
+           @param layer: A L{ParallaxLayer}.
+           @return: The layer that was added.
+        """
+        self._entities.parallax.append(layer)
+        return layer
+
+    def removeParallaxLayer(self, layer):
+        """Removes a background layer.
+
+           @param layer: A L{ParallaxLayer} that was added with
+               L{addParallaxLayer}.
+        """
+        self._entities.parallax.remove(layer)
+        return self
+
     def _doCameraFollow(self):
         """Helper function to move the camera to follow an object."""
         if self.focus is not None:
@@ -180,11 +357,29 @@ class World(gameloop.GameLoop):
         while stage in self._stages:
             del self._stages[self._stages.index(stage)]
 
+    def preloadStage(self, stageid):
+        """Starts loading a stage's assets in the background, so that
+           changing to it later doesn't have to wait for them. The progress of
+           the loading (for a loading bar, say) is given by the stage's
+           C{preloadProgress}.
+
+           @param stageid: The index number of the L{Stage}.
+           @return: The L{Preloader} that is loading the stage's assets.
+        """
+        return self._stages[stageid].preload()
+
     def changeStage(self, newid):
         """Change the active stage.
 
+           If the new stage's assets are still being preloaded (see
+           L{preloadStage}), this waits until they are finished.
+
            @param newid: The index number of the new L{Stage}.
         """
+        stage = self._stages[newid]
+        if stage.preloader is not None:
+            stage.preloader.wait()
+
         self._entities.empty()
         self.add(self._stages[newid])
         self._entities.update = self._stages[newid].update
@@ -205,7 +400,7 @@ class World(gameloop.GameLoop):
         else:
             return None
 
-class Stage(Game.Sprite.LayeredDirty):
+class Stage(gameloop.DisplayList):
     def __init__(self, *sprites, **kwargs):
         """A self-contained stage or game state.
 
@@ -219,14 +414,28 @@ class Stage(Game.Sprite.LayeredDirty):
            normally, have no knowledge of each other. This makes them useful for
            levels, menu structures, and many other parts of a game.
 
+           Like the display list of a L{GameLoop}, a Stage keeps track of its
+           sprites' classes, names, and tags, so it can be asked for (say)
+           all its sprites tagged "enemy" using its C{tagged} method.
+
            Each Stage can have its own background, either a solid color or an
            L{Image}. The C{color} and C{background} keywords allow you to create
            a Stage with either of these properties. (If both are specified,
            C{color} is used.)
 
+           A Stage can also keep a list of the image files that it needs, given
+           by the C{assets} keyword or added with L{addAsset}. These can be
+           loaded in the background with L{preload} (or the World's
+           C{preloadStage} method) before the Stage is needed, after which
+           loading them with C{Game.loadImage} doesn't have to decode them.
+
            @keyword color: The solid background color for this Stage.
            @keyword background: The background Image for this Stage.
+           @keyword assets: A list of image filenames that this Stage uses.
         """
+        self.assets = list(kwargs.pop('assets', ()))
+        self.preloader = None
+
         super(Stage, self).__init__(*sprites, **kwargs)
 
         if 'color' in kwargs:
@@ -259,9 +468,97 @@ class Stage(Game.Sprite.LayeredDirty):
         """
         self._eventHandlers = [e for e in self._eventHandlers if e != (evttype,func)]
 
+    def addAsset(self, fname):
+        """Add an image file to the list of this Stage's assets.
+
+           @param fname: The filename of the image.
+        """
+        self.assets.append(fname)
+
+    def preload(self):
+        """Start loading this Stage's assets on a worker thread. If they are
+           already being loaded, this does nothing.
+
+           @return: The L{Preloader} that is loading the assets.
+        """
+        if self.preloader is None:
+            self.preloader = preload.Preloader(self.assets).start()
+        return self.preloader
+
+    def unload(self):
+        """Remove this Stage's assets from the image cache, to free the
+           memory they use. Sprites that have already loaded them keep their
+           own copies."""
+        if self.preloader is not None:
+            self.preloader.wait()
+            self.preloader = None
+        for fname in self.assets:
+            Game.imageCache.pop(fname, None)
+
+    @property
+    def preloadProgress(self):
+        """How much of this Stage's assets have been preloaded, from 0.0 to
+           1.0. This is 0.0 if preloading hasn't been started."""
+        if self.preloader is None:
+            return 0.0
+        return self.preloader.progress
+
     @property
     def handlers(self):
         """The event handlers that this stage contains. This is a list of
            (event type, handler function) pairs."""
         return self._eventHandlers
 
+class Viewport(object):
+    """A part of the screen showing the world from its own camera.
+
+       Viewports are used for split-screen games. They are created with the
+       L{World}'s C{addViewport} method.
+
+       @ivar rect: The area of the screen covered by this viewport.
+       @ivar camera: The position in the game world of the top-left corner of
+           this viewport's view.
+       @ivar focus: The object that this viewport's camera follows, or None.
+    """
+    def __init__(self, rect, focus=None):
+        self.rect = Game.Rect(rect)
+        self.camera = point.Point(0, 0)
+        self.focus = focus
+        if focus is not None:
+            self.camera = point.Point(self._target())
+
+    def follow(self, o):
+        """Sets the camera to follow a specific object.
+
+           @param o: The object to follow.
+        """
+        self.focus = o
+
+    def getWorldRect(self):
+        """Returns a Rect object containing the area of the world that
+           this viewport shows."""
+        return Game.Rect(int(round(self.camera.x)), int(round(self.camera.y)),
+                         self.rect.width, self.rect.height)
+
+    def _target(self):
+        """The camera position that centers the focus in this viewport."""
+        return (self.focus.x - self.rect.width / 2.,
+                self.focus.y - self.rect.height / 2.)
+
+    def _doCameraFollow(self, world):
+        """Moves the camera toward the focus, at the world's follow speed,
+           and keeps it inside the world's camera bounds."""
+        if self.focus is None:
+            return
+
+        tx, ty = self._target()
+        rate = world._followSpeed * Game.elapsed / 1000.0
+        x = self.camera.x + (tx - self.camera.x) * rate
+        y = self.camera.y + (ty - self.camera.y) * rate
+
+        # the world's bounds are for a full-screen view, so use its extents
+        if world._followMin is not None:
+            bounds = world._bounds
+            x = max(bounds.left, min(x, bounds.right - self.rect.width))
+            y = max(bounds.top, min(y, bounds.bottom - self.rect.height))
+        self.camera.x, self.camera.y = x, y